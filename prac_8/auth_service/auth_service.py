@@ -1,5 +1,9 @@
 from datetime import datetime, timedelta, timezone
+import hashlib
 import os
+import secrets
+import time
+import uuid
 from typing import Optional
 
 from fastapi import FastAPI, Depends, HTTPException, status
@@ -11,29 +15,40 @@ from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from pydantic import BaseModel, EmailStr, constr
-from sqlalchemy import Column, Integer, String, create_engine, select, UniqueConstraint
-from sqlalchemy.orm import declarative_base, sessionmaker, Session
-from passlib.context import CryptContext
+from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Integer, String, UniqueConstraint,
+                        event, select, update)
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt, JWTError
 from starlette.responses import JSONResponse
 
+from cache import TTLCache
+from database import Base, SessionLocal, engine, get_db, init_db
+from hashing import HashingPool, HashingPoolSaturated, HASH_RETRY_AFTER_SEC
+from keys import load_signing_keys
+
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me")
-ALGORITHM = "HS256"
+# HS256 (общий секрет) или RS256/ES256 — тогда публичный ключ отдаётся через /.well-known/jwks.json
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+# Непрозрачный refresh token: продление сессии без пароля и без bcrypt
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+KEYS = load_signing_keys(ALGORITHM, SECRET_KEY)
+
+# Кэш /verify: sha256(token) -> (sub, exp), живёт не дольше exp токена
+VERIFY_CACHE_SIZE = int(os.getenv("VERIFY_CACHE_SIZE", "10000"))
+VERIFY_CACHE_MAX_AGE = int(os.getenv("VERIFY_CACHE_MAX_AGE", "60"))  # для Cache-Control шлюзам
+verify_cache = TTLCache(VERIFY_CACHE_SIZE)
+
+# Кэш пользователей для /me: id -> MeOut, сбрасывается при изменении записи
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SEC = int(os.getenv("USER_CACHE_TTL_SEC", "300"))
+user_cache = TTLCache(USER_CACHE_SIZE)
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./auth.db")
 JAEGER_URL = os.getenv("JAEGER_URL")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+hashing_pool = HashingPool()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-Base = declarative_base()
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
 resource = Resource.create({
     "service.name": "auth_service"
 })
@@ -53,7 +68,23 @@ class User(Base):
     email = Column(String(256), nullable=False, index=True)
     password_hash = Column(String(255), nullable=False)
 
-Base.metadata.create_all(bind=engine)
+class RefreshToken(Base):
+    """
+    Хранится только sha256 токена. Все токены одной цепочки ротаций имеют общий family_id:
+    повторное предъявление уже использованного токена отзывает всю цепочку.
+    """
+    __tablename__ = "refresh_tokens"
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    family_id = Column(String(32), nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked = Column(Boolean, nullable=False, default=False)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target: User):
+    invalidate_user_cache(target.id)
 
 Username = constr(strip_whitespace=True, min_length=3, max_length=64)
 Password = constr(min_length=8, max_length=128)
@@ -72,6 +103,11 @@ class TokenOut(BaseModel):
     access_token: str
     token_type: str = "bearer"
     expires_at: datetime
+    refresh_token: Optional[str] = None
+    refresh_expires_at: Optional[datetime] = None
+
+class RefreshIn(BaseModel):
+    refresh_token: constr(min_length=1, max_length=256)
 
 class VerifyOut(BaseModel):
     active: bool
@@ -83,53 +119,142 @@ class MeOut(BaseModel):
     username: str
     email: EmailStr
 
-def get_db():
-    db: Session = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(password: str, password_hash: str) -> bool:
-    return pwd_context.verify(password, password_hash)
+async def hash_password(password: str) -> str:
+    return await hashing_pool.hash(password)
 
 def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> tuple[str, datetime]:
     expire = datetime.now(tz=timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode = {"sub": subject, "exp": expire}
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, KEYS.signing_key, algorithm=ALGORITHM, headers=KEYS.headers)
     return encoded_jwt, expire
 
-def get_user_by_username(db: Session, username: str) -> Optional[User]:
-    return db.execute(select(User).where(User.username == username)).scalar_one_or_none()
+def decode_token(token: str) -> dict:
+    return jwt.decode(token, KEYS.verify_key, algorithms=[ALGORITHM])
+
+def verify_token_cached(token: str) -> tuple[str, float]:
+    """Возвращает (sub, exp); полный jwt.decode только при промахе кэша. Бросает JWTError."""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    cached = verify_cache.get(key)
+    if cached is not None:
+        return cached
+    payload = decode_token(token)
+    sub = payload.get("sub")
+    if sub is None:
+        raise JWTError("sub is missing")
+    result = (str(sub), float(payload["exp"]))
+    verify_cache.set(key, result, expires_at=result[1])
+    return result
+
+def hash_refresh_token(token: str) -> str:
+    # токен случайный (256 бит), поэтому быстрого sha256 достаточно — bcrypt здесь не нужен
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite возвращает naive datetime
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+async def issue_refresh_token(db: AsyncSession, user_id: int, family_id: Optional[str] = None) -> tuple[str, datetime]:
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.now(tz=timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    db.add(RefreshToken(
+        token_hash=hash_refresh_token(token),
+        user_id=user_id,
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=expires_at,
+    ))
+    await db.commit()
+    return token, expires_at
+
+async def revoke_refresh_family(db: AsyncSession, family_id: str):
+    await db.execute(update(RefreshToken).where(RefreshToken.family_id == family_id).values(revoked=True))
+    await db.commit()
+
+async def rotate_refresh_token(db: AsyncSession, token: str) -> Optional[tuple[int, str, datetime]]:
+    """
+    Обменивает refresh token на новый из той же цепочки: (user_id, token, expires_at).
+    None — токен неизвестен, истёк или отозван; повторное использование отзывает всю цепочку.
+    """
+    row = (await db.execute(
+        select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(token))
+    )).scalar_one_or_none()
+    if row is None:
+        return None
+    if row.revoked:
+        # токен уже обменян — вероятно, украден: отзываем все токены этой сессии
+        await revoke_refresh_family(db, row.family_id)
+        return None
+    if _as_utc(row.expires_at) <= datetime.now(tz=timezone.utc):
+        return None
+    # условный UPDATE вместо SELECT ... FOR UPDATE (в SQLite его нет): из параллельных обменов
+    # одного токена отзыв выполнит только один, остальные считаются повторным использованием
+    claimed = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == row.id, RefreshToken.revoked.is_(False))
+        .values(revoked=True)
+        .execution_options(synchronize_session=False)
+    )
+    if claimed.rowcount != 1:
+        await db.rollback()
+        await revoke_refresh_family(db, row.family_id)
+        return None
+    new_token, expires_at = await issue_refresh_token(db, row.user_id, row.family_id)
+    return row.user_id, new_token, expires_at
+
+async def revoke_refresh_token(db: AsyncSession, token: str):
+    row = (await db.execute(
+        select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(token))
+    )).scalar_one_or_none()
+    if row is not None:
+        await revoke_refresh_family(db, row.family_id)
+
+def invalidate_user_cache(user_id: int):
+    user_cache.delete(int(user_id))
+
+async def get_cached_user(user_id: int) -> Optional["MeOut"]:
+    """Профиль пользователя по id: из кэша, при промахе — из БД (сессия открывается только тогда)"""
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    async with SessionLocal() as db:
+        user = await db.get(User, user_id)
+        if user is None:
+            return None
+        profile = MeOut(id=user.id, username=user.username, email=user.email)
+    user_cache.set(user_id, profile, expires_at=time.time() + USER_CACHE_TTL_SEC)
+    return profile
 
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
-    return db.execute(select(User).where(User.email == email)).scalar_one_or_none()
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    return (await db.execute(select(User).where(User.username == username))).scalar_one_or_none()
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-    user = get_user_by_username(db, username)
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    return (await db.execute(select(User).where(User.email == email))).scalar_one_or_none()
+
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
+    user = await get_user_by_username(db, username)
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    valid, new_hash = await hashing_pool.verify_and_update(password, user.password_hash)
+    if not valid:
         return None
+    if new_hash:
+        # BCRYPT_ROUNDS поменялся — прозрачно перехэшируем пароль с новой стоимостью
+        user.password_hash = new_hash
+        await db.commit()
     return user
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> MeOut:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Невалидный токен",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+        # sub — это user.id (см. login), а не username
+        sub, _ = verify_token_cached(token)
+        user_id = int(sub)
+    except (JWTError, ValueError):
         raise credentials_exception
-    user = get_user_by_username(db, username)
+    user = await get_cached_user(user_id)
     if user is None:
         raise credentials_exception
     return user
@@ -140,41 +265,101 @@ from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 app = FastAPI(title="Auth Service", version="1.0.0")
 FastAPIInstrumentor.instrument_app(app)
 
+@app.exception_handler(HashingPoolSaturated)
+async def hashing_pool_saturated(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Сервис перегружен, повторите позже"},
+        headers={"Retry-After": str(HASH_RETRY_AFTER_SEC)},
+    )
+
+@app.on_event("startup")
+async def create_tables():
+    await init_db()
+
+@app.on_event("shutdown")
+async def shutdown_resources():
+    hashing_pool.shutdown()
+    await engine.dispose()
+
+async def _save_user(db: AsyncSession, user: User) -> User:
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    return user
+
 @app.post("/register", response_model=RegisterOut, status_code=201)
-def register(body: RegisterIn, db: Session = Depends(get_db)):
-    if get_user_by_username(db, body.username):
+async def register(body: RegisterIn, db: AsyncSession = Depends(get_db)):
+    if await get_user_by_username(db, body.username):
         raise HTTPException(status_code=409, detail="Такой username уже занят")
-    if get_user_by_email(db, body.email):
+    if await get_user_by_email(db, body.email):
         raise HTTPException(status_code=409, detail="Такой email уже зарегистрирован")
     user = User(
         username=body.username,
         email=body.email,
-        password_hash=hash_password(body.password),
+        password_hash=await hash_password(body.password),
     )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    user = await _save_user(db, user)
     return RegisterOut(id=user.id, username=user.username, email=user.email)
 
 @app.post("/login", response_model=TokenOut)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Неверные учетные данные")
     token, expires_at = create_access_token(subject=str(user.id))
-    return TokenOut(access_token=token, expires_at=expires_at)
+    refresh_token, refresh_expires_at = await issue_refresh_token(db, user.id)
+    return TokenOut(
+        access_token=token,
+        expires_at=expires_at,
+        refresh_token=refresh_token,
+        refresh_expires_at=refresh_expires_at,
+    )
+
+@app.post("/token/refresh", response_model=TokenOut)
+async def refresh(body: RefreshIn, db: AsyncSession = Depends(get_db)):
+    rotated = await rotate_refresh_token(db, body.refresh_token)
+    if rotated is None:
+        raise HTTPException(status_code=401, detail="Невалидный refresh token")
+    user_id, refresh_token, refresh_expires_at = rotated
+    token, expires_at = create_access_token(subject=str(user_id))
+    return TokenOut(
+        access_token=token,
+        expires_at=expires_at,
+        refresh_token=refresh_token,
+        refresh_expires_at=refresh_expires_at,
+    )
+
+@app.post("/token/revoke", status_code=204)
+async def revoke(body: RefreshIn, db: AsyncSession = Depends(get_db)):
+    # logout: отзывается вся цепочка; неизвестный токен — тоже 204, чтобы не раскрывать существование
+    await revoke_refresh_token(db, body.refresh_token)
+    return Response(status_code=204)
 
 @app.get("/verify")
-def verify(token: str = Depends(oauth2_scheme)):
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    sub = payload.get("sub")
+async def verify(token: str = Depends(oauth2_scheme)):
+    try:
+        sub, exp = verify_token_cached(token)
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Невалидный токен",
+            headers={"WWW-Authenticate": "Bearer", "Cache-Control": "no-store"},
+        )
+    # шлюз может кэшировать ответ по токену, но не дольше жизни токена
+    max_age = max(0, min(VERIFY_CACHE_MAX_AGE, int(exp - time.time())))
     return JSONResponse(
-        content={"active": True, "user_id": str(sub)},
-        headers={"X-User-Id": str(sub)},
+        content={"active": True, "user_id": sub},
+        headers={"X-User-Id": sub, "Cache-Control": f"max-age={max_age}", "Vary": "Authorization"},
         status_code=200,
     )
 
+@app.get("/.well-known/jwks.json")
+def jwks():
+    # пустой набор ключей для HS256: локальная проверка возможна только с асимметричной подписью
+    return JSONResponse(content=KEYS.jwks(), headers={"Cache-Control": "public, max-age=300"})
+
 @app.get("/me", response_model=MeOut)
-def me(current_user: User = Depends(get_current_user)):
-    return MeOut(id=current_user.id, username=current_user.username, email=current_user.email)
+async def me(current_user: MeOut = Depends(get_current_user)):
+    return current_user
 
@@ -0,0 +1,56 @@
+"""
+Login throughput (bcrypt verify in the hashing process pool) at different bcrypt costs.
+
+    python bench_login.py --costs 8 10 12 --requests 200 --pool-size 4
+"""
+import argparse
+import asyncio
+import time
+
+from hashing import HashingPool, HashingPoolSaturated
+
+
+async def run(cost: int, requests: int, pool_size: int, concurrency: int) -> tuple[float, int]:
+    pool = HashingPool(size=pool_size, queue_limit=concurrency, rounds=cost)
+    try:
+        password_hash = await pool.hash("password123")
+        await pool.verify_and_update("password123", password_hash)  # warm up workers
+
+        rejected = 0
+        queue = asyncio.Queue()
+        for _ in range(requests):
+            queue.put_nowait(None)
+
+        async def client():
+            nonlocal rejected
+            while not queue.empty():
+                queue.get_nowait()
+                try:
+                    valid, _ = await pool.verify_and_update("password123", password_hash)
+                    assert valid
+                except HashingPoolSaturated:
+                    rejected += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return (requests - rejected) / (time.perf_counter() - started), rejected
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--costs", type=int, nargs="+", default=[8, 10, 12])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"{'cost':>6}{'logins/s':>12}{'ms/login':>12}{'rejected':>10}")
+    for cost in args.costs:
+        rate, rejected = asyncio.run(run(cost, args.requests, args.pool_size, args.concurrency))
+        print(f"{cost:>6}{rate:>12.1f}{1000 * args.pool_size / rate:>12.1f}{rejected:>10}")
+
+
+if __name__ == "__main__":
+    main()
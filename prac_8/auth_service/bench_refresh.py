@@ -0,0 +1,79 @@
+"""
+Auth CPU for keeping clients signed in: hourly password re-login vs refresh-token rotation.
+
+Every simulated client renews its session once per access-token lifetime for --hours hours.
+CPU is measured for this process and the bcrypt pool workers together (workers are
+reaped before reading RUSAGE_CHILDREN).
+
+    python bench_refresh.py --clients 20 --hours 24 --rounds 12
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+
+def cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def run(service, client, scenario: str, users: list[str], hours: int) -> tuple[int, float, float]:
+    from hashing import HashingPool
+
+    service.hashing_pool = HashingPool(size=2, rounds=service.hashing_pool.rounds)
+    requests = 0
+    cpu_started, wall_started = cpu_seconds(), time.perf_counter()
+
+    refresh_tokens = {}
+    for hour in range(hours):
+        for username in users:
+            if scenario == "refresh" and hour > 0:
+                resp = client.post("/token/refresh", json={"refresh_token": refresh_tokens[username]})
+            else:
+                resp = client.post("/login", data={"username": username, "password": "password123"})
+            assert resp.status_code == 200, resp.text
+            refresh_tokens[username] = resp.json()["refresh_token"]
+            requests += 1
+
+    service.hashing_pool.shutdown(wait=True)
+    return requests, cpu_seconds() - cpu_started, time.perf_counter() - wall_started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+
+    # отдельная БД, чтобы не трогать auth.db; модуль читает настройки при импорте
+    db_dir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(db_dir, 'bench.db')}"
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+
+    from fastapi.testclient import TestClient
+    import auth_service as service
+
+    with TestClient(service.app) as client:  # startup создаёт таблицы
+        users = [f"bench_user_{i}" for i in range(args.clients)]
+        for username in users:
+            resp = client.post("/register", json={
+                "username": username, "email": f"{username}@example.com", "password": "password123",
+            })
+            assert resp.status_code == 201, resp.text
+        service.hashing_pool.shutdown(wait=True)
+
+        print(f"{'scenario':>10}{'requests':>10}{'cpu s':>10}{'cpu ms/req':>12}{'wall s':>10}")
+        results = {}
+        for scenario in ("relogin", "refresh"):
+            requests, cpu, wall = run(service, client, scenario, users, args.hours)
+            results[scenario] = cpu
+            print(f"{scenario:>10}{requests:>10}{cpu:>10.2f}{1000 * cpu / requests:>12.2f}{wall:>10.2f}")
+        print(f"refresh uses {results['relogin'] / results['refresh']:.1f}x less CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./auth.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SEC = int(os.getenv("DB_POOL_TIMEOUT_SEC", "5"))
+DB_POOL_RECYCLE_SEC = int(os.getenv("DB_POOL_RECYCLE_SEC", "1800"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Async drivers for the usual URLs: postgresql:// -> asyncpg, sqlite:// -> aiosqlite
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+Base = declarative_base()
+
+
+def async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+def _engine_options(url: str) -> dict:
+    # соединения держим открытыми между запросами; короткий pool_timeout — быстрый отказ вместо очереди
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SEC,
+    }
+    if not url.startswith("sqlite"):
+        # Postgres: проверка перед выдачей и пересоздание до серверных/NAT таймаутов простоя
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = DB_POOL_RECYCLE_SEC
+    return options
+
+
+def _enable_sqlite_wal(dbapi_connection, connection_record):
+    # WAL: читатели не блокируются писателем, synchronous=NORMAL достаточно для WAL
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+engine = create_async_engine(async_url(DATABASE_URL), **_engine_options(DATABASE_URL))
+if DATABASE_URL.startswith("sqlite"):
+    event.listen(engine.sync_engine, "connect", _enable_sqlite_wal)
+
+# expire_on_commit=False: после commit атрибуты читаются без неявного (синхронного) запроса
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
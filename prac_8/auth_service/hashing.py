@@ -0,0 +1,82 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+# bcrypt runs in a dedicated process pool: a login burst can no longer take all
+# threadpool threads from /verify and /me, and hashing uses every core despite the GIL
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", str(os.cpu_count() or 2)))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))  # hashes in flight + waiting
+HASH_RETRY_AFTER_SEC = int(os.getenv("HASH_RETRY_AFTER_SEC", "2"))
+
+_contexts: dict[int, CryptContext] = {}
+
+
+def _context(rounds: int) -> CryptContext:
+    # min = max = default: hashes with any other cost are reported as needing update
+    if rounds not in _contexts:
+        _contexts[rounds] = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds,
+        )
+    return _contexts[rounds]
+
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def _verify_and_update(password: str, password_hash: str, rounds: int) -> tuple[bool, Optional[str]]:
+    return _context(rounds).verify_and_update(password, password_hash)
+
+
+class HashingPoolSaturated(Exception):
+    pass
+
+
+class HashingPool:
+    def __init__(self, size: int = HASH_POOL_SIZE, queue_limit: int = HASH_QUEUE_LIMIT,
+                 rounds: int = BCRYPT_ROUNDS):
+        self.size = size
+        self.queue_limit = queue_limit
+        self.rounds = rounds
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # created lazily; spawn, so children do not inherit OTel/uvicorn threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.size,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _submit(self, fn, *args):
+        if self.pending >= self.queue_limit:
+            raise HashingPoolSaturated()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password, self.rounds)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+        """(valid, new_hash): new_hash is set when the stored hash uses another cost"""
+        return await self._submit(_verify_and_update, password, password_hash, self.rounds)
+
+    def shutdown(self, wait: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,76 @@
+import hashlib
+import os
+from typing import Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk
+
+# Asymmetric algorithms supported by python-jose; tokens can be verified with the public JWKS only
+ASYMMETRIC_ALGORITHMS = ("RS256", "RS384", "RS512", "ES256", "ES384", "ES512")
+
+
+class SigningKeys:
+    def __init__(self, algorithm: str, signing_key: str, verify_key: str,
+                 kid: Optional[str] = None, public_jwk: Optional[dict] = None):
+        self.algorithm = algorithm
+        self.signing_key = signing_key
+        self.verify_key = verify_key
+        self.kid = kid
+        self.public_jwk = public_jwk
+
+    @property
+    def headers(self) -> Optional[dict]:
+        return {"kid": self.kid} if self.kid else None
+
+    def jwks(self) -> dict:
+        return {"keys": [self.public_jwk] if self.public_jwk else []}
+
+
+def _read_pem(path_env: str, value_env: str) -> Optional[str]:
+    path = os.getenv(path_env)
+    if path:
+        with open(path) as f:
+            return f.read()
+    return os.getenv(value_env)
+
+
+def _generate_private_key(algorithm: str):
+    if algorithm.startswith("RS"):
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    curve = {"ES256": ec.SECP256R1(), "ES384": ec.SECP384R1(), "ES512": ec.SECP521R1()}[algorithm]
+    return ec.generate_private_key(curve)
+
+
+def load_signing_keys(algorithm: str, secret_key: str) -> SigningKeys:
+    """
+    HS*: shared SECRET_KEY, nothing to publish.
+    RS*/ES*: private key from JWT_PRIVATE_KEY_PATH / JWT_PRIVATE_KEY (PEM), public key is published as JWKS.
+    Without a configured key an ephemeral one is generated (dev only: tokens die on restart
+    and replicas do not share it).
+    """
+    if algorithm.startswith("HS"):
+        return SigningKeys(algorithm, secret_key, secret_key)
+    if algorithm not in ASYMMETRIC_ALGORITHMS:
+        raise ValueError(f"Unsupported JWT_ALGORITHM: {algorithm}")
+
+    private_pem = _read_pem("JWT_PRIVATE_KEY_PATH", "JWT_PRIVATE_KEY")
+    if private_pem:
+        private_key = serialization.load_pem_private_key(private_pem.encode(), password=None)
+    else:
+        print(f"WARNING: JWT_PRIVATE_KEY is not set, generating ephemeral {algorithm} key")
+        private_key = _generate_private_key(algorithm)
+        private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode()
+
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+
+    kid = hashlib.sha256(public_pem.encode()).hexdigest()[:16]
+    public_jwk = {**jwk.construct(public_pem, algorithm).to_dict(), "kid": kid, "use": "sig"}
+    return SigningKeys(algorithm, private_pem, public_pem, kid=kid, public_jwk=public_jwk)
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+import urllib.request
+from typing import Optional
+
+from fastapi import Header, HTTPException
+from jose import jwt, JWTError
+
+# JWKS of auth_service (RS256/ES256 mode); when set, bearer tokens are verified locally
+AUTH_JWKS_URL = os.getenv("AUTH_JWKS_URL")
+JWKS_CACHE_TTL_SEC = float(os.getenv("JWKS_CACHE_TTL_SEC", "300"))
+# unknown kid triggers a refetch, but not more often than this (key rotation)
+JWKS_MIN_REFRESH_SEC = float(os.getenv("JWKS_MIN_REFRESH_SEC", "30"))
+
+
+class JWKSUnavailable(Exception):
+    """JWKS could not be fetched and no cached copy exists"""
+
+
+class JWKSClient:
+    """Caches auth_service public keys so tokens are checked without a network hop"""
+
+    def __init__(self, url: str, ttl_sec: float = JWKS_CACHE_TTL_SEC):
+        self.url = url
+        self.ttl_sec = ttl_sec
+        self._jwks: Optional[dict] = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        with urllib.request.urlopen(self.url, timeout=5) as resp:
+            self._jwks = json.loads(resp.read())
+        self._fetched_at = time.monotonic()
+
+    def get_jwks(self, kid: Optional[str] = None) -> dict:
+        with self._lock:
+            age = time.monotonic() - self._fetched_at
+            known = self._jwks is not None and (
+                kid is None or any(k.get("kid") == kid for k in self._jwks.get("keys", []))
+            )
+            if self._jwks is None or age > self.ttl_sec or (not known and age > JWKS_MIN_REFRESH_SEC):
+                try:
+                    self._fetch()
+                except Exception as e:
+                    if self._jwks is None:
+                        raise JWKSUnavailable(str(e)) from e
+                    print(f"JWKS refresh failed, using cached keys: {e}")
+            return self._jwks
+
+    def verify(self, token: str) -> Optional[dict]:
+        """Token claims; None when auth_service publishes no keys (HS256 mode, tokens checked by /verify)"""
+        header = jwt.get_unverified_header(token)
+        jwks = self.get_jwks(header.get("kid"))
+        if not jwks.get("keys"):
+            return None
+        algorithms = sorted({k["alg"] for k in jwks["keys"] if "alg" in k})
+        return jwt.decode(token, jwks, algorithms=algorithms)
+
+
+jwks_client = JWKSClient(AUTH_JWKS_URL) if AUTH_JWKS_URL else None
+
+
+def get_user_id(
+        authorization: Optional[str] = Header(None),
+        user_id: Optional[str] = Header(None, alias="user-id"),
+) -> str:
+    """
+    User id for the request: verified locally from the bearer token when AUTH_JWKS_URL
+    is configured and auth_service publishes keys, otherwise taken from the user-id header
+    set by the gateway after /verify.
+    """
+    if jwks_client and authorization and authorization.lower().startswith("bearer "):
+        try:
+            payload = jwks_client.verify(authorization.split(" ", 1)[1].strip())
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+        except JWKSUnavailable:
+            raise HTTPException(status_code=503, detail="Token keys unavailable")
+        if payload is not None:
+            if payload.get("sub") is None:
+                raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+            return str(payload["sub"])
+
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return user_id
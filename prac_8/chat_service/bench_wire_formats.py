@@ -0,0 +1,59 @@
+"""
+Benchmark of request size and parse time for POST /v1/measurements/json wire formats.
+
+    python bench_wire_formats.py --fs 1000 --minutes 10 --repeat 5
+"""
+import argparse
+import gzip
+import json
+import time
+
+import msgpack
+import numpy as np
+
+from wire_formats import decode_measurement_body
+
+
+def build_payloads(ecg: np.ndarray, fs: int, state: str) -> dict:
+    as_list = ecg.tolist()
+    json_body = json.dumps({"ecg": as_list, "fs": fs, "state": state}).encode()
+    query = {"fs": str(fs), "state": state}
+    return {
+        "json": (json_body, {"content-type": "application/json"}, {}),
+        "json+gzip": (gzip.compress(json_body, compresslevel=6),
+                      {"content-type": "application/json", "content-encoding": "gzip"}, {}),
+        "msgpack (array)": (msgpack.packb({"ecg": as_list, "fs": fs, "state": state}),
+                            {"content-type": "application/msgpack"}, {}),
+        "msgpack (bin f32)": (msgpack.packb({"ecg": ecg.astype("<f4").tobytes(), "fs": fs, "state": state}),
+                              {"content-type": "application/msgpack"}, {}),
+        "raw float32": (ecg.astype("<f4").tobytes(), {"content-type": "application/x-ecg-float32"}, query),
+        "raw int16": (np.round(ecg * 1000).astype("<i2").tobytes(),
+                      {"content-type": "application/x-ecg-int16", "x-ecg-scale": "0.001"}, query),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fs", type=int, default=1000)
+    parser.add_argument("--minutes", type=float, default=10.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    n = int(args.fs * args.minutes * 60)
+    t = np.arange(n) / args.fs
+    ecg = (np.sin(2 * np.pi * 1.2 * t) + 0.05 * np.random.default_rng(0).standard_normal(n)).astype(np.float32)
+
+    print(f"{n} samples ({args.minutes} min @ {args.fs} Hz)")
+    print(f"{'format':<20}{'size, MB':>12}{'parse, ms':>12}")
+    for name, (body, headers, query) in build_payloads(ecg, args.fs, "rest").items():
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            decoded = decode_measurement_body(body, headers, query)
+            timings.append(time.perf_counter() - started)
+        assert len(decoded.ecg) == n
+        print(f"{name:<20}{len(body) / 1e6:>12.2f}{min(timings) * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+In-memory stand-ins for MinIO and RabbitMQ plus a fake analysis worker, for load tests without infrastructure.
+
+    CHAT_BACKENDS=memory DATABASE_URL=sqlite:////tmp/chat.db uvicorn main:app --port 8080
+
+install() swaps services.MinIOService / services.RabbitMQService for the classes below (MeasurementService
+looks them up on every request) and starts FakeAnalysisWorker, which consumes both request lanes and replies
+on the response queue after FAKE_WORKER_DELAY_SEC, like ecg_analysis_service. The database stays behind
+get_db: point DATABASE_URL at SQLite. See loadtest.py for the load generator.
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from minio.error import S3Error
+
+from services import ANALYSIS_TTL_SEC, RabbitMQService
+
+FAKE_WORKER_DELAY_SEC = float(os.getenv("FAKE_WORKER_DELAY_SEC", "0.5"))
+FAKE_WORKER_JITTER_SEC = float(os.getenv("FAKE_WORKER_JITTER_SEC", "0.1"))
+FAKE_WORKER_CONCURRENCY = int(os.getenv("FAKE_WORKER_CONCURRENCY", "8"))
+FAKE_WORKER_ERROR_RATE = float(os.getenv("FAKE_WORKER_ERROR_RATE", "0"))
+FAKE_LABELS = ("Normal", "AF", "PVC")
+
+
+class InMemoryBroker:
+    """Named FIFO queues shared by publishers and consumers of one process"""
+
+    def __init__(self):
+        self._queues: Dict[str, queue.Queue] = defaultdict(queue.Queue)
+        self._lock = threading.Lock()
+        self.cancelled = set()
+
+    def queue(self, name: str) -> queue.Queue:
+        with self._lock:
+            return self._queues[name]
+
+    def publish(self, routing_key: str, body: bytes, correlation_id: Optional[str] = None,
+                reply_to: Optional[str] = None):
+        props = SimpleNamespace(correlation_id=correlation_id, reply_to=reply_to, headers=None)
+        self.queue(routing_key).put((props, body))
+
+    def depth(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: q.qsize() for name, q in self._queues.items()}
+
+
+BROKER = InMemoryBroker()
+_OBJECTS: Dict[str, bytes] = {}
+_OBJECTS_LOCK = threading.Lock()
+
+
+class InMemoryMinIOService:
+    """Same interface as services.MinIOService, objects live in a process-wide dict"""
+
+    def __init__(self):
+        self.endpoint = "memory"
+        self.bucket = os.getenv("ECG_BUCKET", "ecg-bucket")
+
+    def upload_file(self, object_name: str, file_content: bytes, content_type: str = "application/octet-stream") -> str:
+        with _OBJECTS_LOCK:
+            _OBJECTS[object_name] = bytes(file_content)
+        return f"{self.endpoint}/{self.bucket}/{object_name}"
+
+    def _get(self, object_name: str) -> bytes:
+        with _OBJECTS_LOCK:
+            if object_name not in _OBJECTS:
+                raise S3Error(None, "NoSuchKey", "Object does not exist", object_name, None, None,
+                              self.bucket, object_name)
+            return _OBJECTS[object_name]
+
+    def remove_file(self, object_name: str):
+        with _OBJECTS_LOCK:
+            _OBJECTS.pop(object_name, None)
+
+    def object_size(self, object_name: str) -> int:
+        return len(self._get(object_name))
+
+    def read_file(self, object_name: str, offset: int = 0, length: int = 0) -> bytes:
+        data = self._get(object_name)
+        return data[offset:offset + length] if length else data[offset:]
+
+    def download_file(self, object_name: str, file_path: str):
+        with open(file_path, "wb") as f:
+            f.write(self._get(object_name))
+
+    def remove_prefix(self, prefix: str):
+        with _OBJECTS_LOCK:
+            for name in [n for n in _OBJECTS if n.startswith(prefix)]:
+                del _OBJECTS[name]
+
+
+class InMemoryRabbitMQService(RabbitMQService):
+    """RabbitMQService over InMemoryBroker: same queues, lanes, deadlines and reply routing"""
+
+    def _body(self, message: dict, ttl: float) -> bytes:
+        now = time.time()
+        return json.dumps({**message, "deadline": now + ttl, "published_at": now}).encode("utf-8")
+
+    def publish_analysis_message(self, message: dict):
+        BROKER.publish(self.queue_for_lane(message.get("lane", "short")), self._body(message, ANALYSIS_TTL_SEC))
+
+    def publish_confirmed_batch(self, messages: List[dict], reply_to: str):
+        for message in messages:
+            BROKER.publish(self.queue_for_lane(message.get("lane", "short")), self._body(message, ANALYSIS_TTL_SEC),
+                           correlation_id=message["correlation_id"], reply_to=reply_to)
+
+    def publish_outbox_batch(self, messages: List[dict], headers: List[Optional[dict]]):
+        for message in messages:
+            BROKER.publish(self.queue_for_lane(message.get("lane", "short")), self._body(message, ANALYSIS_TTL_SEC))
+
+    def publish_cancel(self, measurement_id: str):
+        BROKER.cancelled.add(measurement_id)
+
+    def call_analysis(self, message: dict, timeout: float) -> Optional[dict]:
+        reply_to = f"rpc-{uuid.uuid4()}"
+        correlation_id = message["measurement_id"]
+        BROKER.publish(self.request_queue, self._body(message, timeout),
+                       correlation_id=correlation_id, reply_to=reply_to)
+        deadline = time.monotonic() + timeout
+        replies = BROKER.queue(reply_to)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                props, body = replies.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if props.correlation_id == correlation_id:
+                return json.loads(body.decode("utf-8"))
+
+    def start_response_consumer(self, on_response, queue: Optional[str] = None):
+        queue = queue or self.response_queue
+        messages = BROKER.queue(queue)
+        delivery_tag = 0
+        while True:
+            props, body = messages.get()
+            delivery_tag += 1
+            try:
+                on_response(None, SimpleNamespace(routing_key=queue, delivery_tag=delivery_tag), props, body)
+            except Exception as e:
+                print(f"In-memory consumer of {queue}: {e}")
+
+
+class FakeAnalysisWorker:
+    """
+    Stand-in for ecg_analysis_service: `concurrency` consumers per lane, each answers one job after
+    delay_sec plus exponential jitter with random probabilities (or an error with error_rate).
+    """
+
+    def __init__(self, delay_sec: float = FAKE_WORKER_DELAY_SEC, jitter_sec: float = FAKE_WORKER_JITTER_SEC,
+                 concurrency: int = FAKE_WORKER_CONCURRENCY, error_rate: float = FAKE_WORKER_ERROR_RATE,
+                 broker: InMemoryBroker = BROKER):
+        self.delay_sec = delay_sec
+        self.jitter_sec = jitter_sec
+        self.concurrency = concurrency
+        self.error_rate = error_rate
+        self.broker = broker
+        self.rabbitmq_service = RabbitMQService()
+        self.processed = 0
+
+    def start(self):
+        for queue_name in (self.rabbitmq_service.request_queue, self.rabbitmq_service.long_request_queue):
+            for i in range(self.concurrency):
+                threading.Thread(target=self._serve, args=(queue_name,), name=f"fake-worker-{queue_name}-{i}",
+                                 daemon=True).start()
+
+    def _serve(self, queue_name: str):
+        rng = random.Random()
+        requests = self.broker.queue(queue_name)
+        while True:
+            props, body = requests.get()
+            msg = json.loads(body.decode("utf-8"))
+            measurement_id = msg["measurement_id"]
+            if measurement_id in self.broker.cancelled:
+                continue
+            if time.time() > msg.get("deadline", float("inf")):
+                response = {"status": "error", "error": "deadline exceeded", "measurement_id": measurement_id}
+            else:
+                time.sleep(self.delay_sec + (rng.expovariate(1 / self.jitter_sec) if self.jitter_sec > 0 else 0))
+                if rng.random() < self.error_rate:
+                    response = {"status": "error", "error": "fake worker error", "measurement_id": measurement_id}
+                else:
+                    response = {
+                        "status": "ok",
+                        "features": {label: round(rng.random(), 3) for label in FAKE_LABELS},
+                        "llm_summary": None,
+                        "measurement_id": measurement_id,
+                        "model_version": "fake",
+                    }
+            self.processed += 1
+            self.broker.publish(props.reply_to or self.rabbitmq_service.response_queue,
+                                json.dumps(response).encode("utf-8"), correlation_id=props.correlation_id)
+
+
+def install(start_worker: bool = True, **worker_kwargs) -> Optional[FakeAnalysisWorker]:
+    """Swap MinIO/RabbitMQ in services for the in-memory stand-ins; returns the started fake worker"""
+    import services
+
+    services.MinIOService = InMemoryMinIOService
+    services.RabbitMQService = InMemoryRabbitMQService
+    if not start_worker:
+        return None
+    worker = FakeAnalysisWorker(**worker_kwargs)
+    worker.start()
+    return worker
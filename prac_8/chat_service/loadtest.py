@@ -0,0 +1,268 @@
+"""
+Offline load test of chat_service: the real FastAPI app in-process, MinIO/RabbitMQ replaced by inmemory.py,
+SQLite behind get_db, a fake analysis worker answering after --worker-delay seconds.
+
+    python loadtest.py --rate 50 --duration 30 --users 20 --mix upload=0.2,list=0.4,get=0.4 \\
+                       --seconds 10 --worker-delay 0.5 --worker-concurrency 8
+
+Requests arrive open-loop at --rate per second (latency counts from the scheduled start, so a
+stalled server is not hidden by a slowed-down client). Every user keeps one WebSocket subscriber;
+upload-to-notification is the time from the upload start to its results_update/error_update push.
+Requests go straight into the ASGI app: the numbers cover the service code, not uvicorn or the network.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+OPERATIONS = ("upload", "list", "get")
+
+
+class AsgiClient:
+    """Minimal in-process ASGI client: HTTP requests, WebSocket sessions and lifespan"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _scope(self, kind: str, path: str, headers: Dict[str, str]) -> dict:
+        url = urlsplit(path)
+        return {
+            "type": kind, "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "http",
+            "path": url.path, "raw_path": url.path.encode(), "query_string": url.query.encode(), "root_path": "",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+            "client": ("127.0.0.1", 50000), "server": ("loadtest", 80),
+        }
+
+    async def request(self, method: str, path: str, headers: Dict[str, str], body: bytes = b"") -> Tuple[int, bytes]:
+        scope = {**self._scope("http", path, headers), "method": method}
+        sent = asyncio.Event()
+        status, chunks = 500, []
+
+        async def receive():
+            if not sent.is_set():
+                sent.set()
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.Event().wait()  # client never disconnects first
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            # ServerErrorMiddleware re-raises after sending the 500; a real server would log and go on
+            status = 500
+        return status, b"".join(chunks)
+
+    async def websocket(self, path: str, on_text) -> "AsgiWebSocket":
+        ws = AsgiWebSocket(self.app, {**self._scope("websocket", path, {}), "subprotocols": []}, on_text)
+        await ws.connect()
+        return ws
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self):
+        incoming: asyncio.Queue = asyncio.Queue()
+        started, stopped = asyncio.Event(), asyncio.Event()
+
+        async def send(message):
+            if message["type"].startswith("lifespan.startup"):
+                started.set()
+            elif message["type"].startswith("lifespan.shutdown"):
+                stopped.set()
+
+        task = asyncio.create_task(self.app({"type": "lifespan", "asgi": {"version": "3.0"}}, incoming.get, send))
+        await incoming.put({"type": "lifespan.startup"})
+        await started.wait()
+        try:
+            yield
+        finally:
+            await incoming.put({"type": "lifespan.shutdown"})
+            await asyncio.wait([task], timeout=5)
+
+
+class AsgiWebSocket:
+    def __init__(self, app, scope: dict, on_text):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.on_text = on_text
+        self.task = asyncio.create_task(app(scope, self.incoming.get, self._send))
+
+    async def _send(self, message):
+        if message["type"] == "websocket.accept":
+            self.accepted.set()
+        elif message["type"] == "websocket.send":
+            self.on_text(message.get("text") or message.get("bytes", b"").decode())
+
+    async def connect(self):
+        await self.incoming.put({"type": "websocket.connect"})
+        await self.accepted.wait()
+
+    async def close(self):
+        await self.incoming.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait([self.task], timeout=5)
+
+
+class LoadStats:
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.upload_started: Dict[str, float] = {}
+        self.notified: Dict[str, float] = {}
+
+    def on_ws_text(self, text: str):
+        message = json.loads(text)
+        if message.get("type") in ("results_update", "error_update"):
+            self.notified.setdefault(message["measurement_id"], time.perf_counter())
+
+    def notification_latency(self) -> List[float]:
+        return [self.notified[m] - t for m, t in self.upload_started.items() if m in self.notified]
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, expected one of {OPERATIONS}")
+        mix[name] = float(weight)
+    return mix
+
+
+async def run_load(client: AsgiClient, stats: LoadStats, rate: float, duration: float, users: int,
+                   mix: Dict[str, float], body: bytes, fs: int) -> float:
+    rng = random.Random(0)
+    names, weights = list(mix), list(mix.values())
+    uploaded: Dict[str, List[str]] = defaultdict(list)
+
+    async def operation(op: str, user_id: str, scheduled: float):
+        headers = {"user-id": user_id}
+        if op == "get" and not uploaded[user_id]:
+            op = "list"
+        if op == "upload":
+            headers["content-type"] = "application/x-ecg-float32"
+            status, payload = await client.request("POST", f"/v1/measurements/json?fs={fs}&state=rest", headers, body)
+            if status == 201:
+                measurement_id = json.loads(payload)["id"]
+                stats.upload_started[measurement_id] = scheduled
+                uploaded[user_id].append(measurement_id)
+        elif op == "list":
+            status, _ = await client.request("GET", "/v1/measurements?limit=20", headers)
+        else:
+            status, _ = await client.request("GET", f"/v1/measurements/{rng.choice(uploaded[user_id])}", headers)
+        stats.latency[op].append(time.perf_counter() - scheduled)
+        if status >= 400:
+            stats.errors[op] += 1
+
+    tasks = []
+    started = time.perf_counter()
+    for i in range(int(rate * duration)):
+        scheduled = started + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        op = rng.choices(names, weights)[0]
+        tasks.append(asyncio.create_task(operation(op, f"load-user-{rng.randrange(users)}", scheduled)))
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - started
+
+
+def percentiles(values: List[float]) -> Tuple[float, float, float]:
+    if not values:
+        return float("nan"), float("nan"), float("nan")
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return p50, p95, p99
+
+
+def report(stats: LoadStats, elapsed: float, args):
+    print(f"rate {args.rate}/s for {args.duration} s, {args.users} users, uploads of {args.seconds} s @ {args.fs} Hz, "
+          f"worker {args.worker_delay} s x {args.worker_concurrency}")
+    print(f"{'operation':<24}{'count':>8}{'errors':>8}{'req/s':>10}{'p50, ms':>10}{'p95, ms':>10}{'p99, ms':>10}")
+    for op in OPERATIONS:
+        values = stats.latency.get(op, [])
+        if values:
+            p50, p95, p99 = percentiles(values)
+            print(f"{op:<24}{len(values):>8}{stats.errors[op]:>8}{len(values) / elapsed:>10.1f}"
+                  f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+    total = sum(len(v) for v in stats.latency.values())
+    p50, p95, p99 = percentiles([x for v in stats.latency.values() for x in v])
+    print(f"{'all':<24}{total:>8}{sum(stats.errors.values()):>8}{total / elapsed:>10.1f}"
+          f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+    latency = stats.notification_latency()
+    p50, p95, p99 = percentiles(latency)
+    print(f"{'upload->notification':<24}{len(latency):>8}{len(stats.upload_started) - len(latency):>8}{'':>10}"
+          f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+
+
+async def main_async(args):
+    # the app reads its backends from the environment at import time
+    tmp = tempfile.mkdtemp(prefix="chat-loadtest-")
+    os.environ.update({
+        "CHAT_BACKENDS": "memory",
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(tmp, 'loadtest.db')}",
+        "FAKE_WORKER_DELAY_SEC": str(args.worker_delay),
+        "FAKE_WORKER_JITTER_SEC": str(args.worker_jitter),
+        "FAKE_WORKER_CONCURRENCY": str(args.worker_concurrency),
+        "FAKE_WORKER_ERROR_RATE": str(args.worker_error_rate),
+    })
+    os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+    os.environ.pop("AUTH_JWKS_URL", None)  # user-id header auth
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        from main import app
+
+    t = np.arange(int(args.seconds * args.fs)) / args.fs
+    ecg = np.exp(-((t % 0.8) - 0.3) ** 2 / 2e-4) + 0.1 * np.sin(2 * np.pi * 0.2 * t)
+    body = ecg.astype("<f4").tobytes()
+
+    stats = LoadStats()
+    client = AsgiClient(app)
+    with quiet:
+        async with client.lifespan():
+            sockets = [await client.websocket(f"/ws/load-user-{u}", stats.on_ws_text) for u in range(args.users)]
+            elapsed = await run_load(client, stats, args.rate, args.duration, args.users, args.mix, body, args.fs)
+            # pending analyses: wait for their pushes (bounded)
+            deadline = time.perf_counter() + args.drain
+            while len(stats.notification_latency()) < len(stats.upload_started) and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+            for ws in sockets:
+                await ws.close()
+    report(stats, elapsed, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=50, help="requests per second (open loop)")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load")
+    parser.add_argument("--users", type=int, default=20, help="users, each with one WebSocket subscriber")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("upload=0.2,list=0.4,get=0.4"))
+    parser.add_argument("--seconds", type=float, default=10, help="length of an uploaded recording")
+    parser.add_argument("--fs", type=int, default=250)
+    parser.add_argument("--worker-delay", type=float, default=0.5, help="fake analysis time, seconds")
+    parser.add_argument("--worker-jitter", type=float, default=0.1, help="mean of exponential extra delay")
+    parser.add_argument("--worker-concurrency", type=int, default=8, help="fake worker consumers per lane")
+    parser.add_argument("--worker-error-rate", type=float, default=0.0)
+    parser.add_argument("--drain", type=float, default=30, help="max wait for outstanding notifications")
+    parser.add_argument("--database-url", help="default: SQLite file in a temp dir")
+    parser.add_argument("--verbose", action="store_true", help="keep the service's own prints")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
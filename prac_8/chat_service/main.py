@@ -4,7 +4,7 @@ import uuid
 from typing import Optional
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Header, WebSocketDisconnect
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Request, Response, WebSocketDisconnect
 from opentelemetry import trace
 from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
 from opentelemetry.sdk.resources import Resource
@@ -13,13 +13,22 @@ from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from sqlalchemy.orm import Session
 from starlette.websockets import WebSocket
 
+from auth import get_user_id
 from database import get_db, init_db
-from models import Measurement, State, MeasurementList
+from metrics import UPLOAD_BYTES, metrics_response, track_requests
+from models import EpisodeList, Measurement, MeasurementSummary, State, MeasurementList, TimelineSlice, Waveform
 from services import MeasurementService
+from waveform import WAVEFORM_DEFAULT_POINTS
 from websocket_manager import websocket_manager
+from wire_formats import decode_measurement_body, UnsupportedMediaType, WireFormatError
 
 load_dotenv()
 
+if os.getenv("CHAT_BACKENDS") == "memory":
+    # MinIO/RabbitMQ stand-ins and a fake analysis worker (load tests), see inmemory.py
+    import inmemory
+    inmemory.install()
+
 JAEGER_URL = os.getenv("JAEGER_URL")
 resource = Resource.create({
     "service.name": "chat_service"
@@ -36,22 +45,30 @@ from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 
 app = FastAPI(title="ECG Measurements API", version="1.0")
 FastAPIInstrumentor.instrument_app(app)
+app.middleware("http")(track_requests)
 
 init_db()
 
 @app.on_event("startup")
 async def startup_event():
-    MeasurementService(next(get_db()), asyncio.get_running_loop()).start_rabbit_listener()
+    service = MeasurementService(next(get_db()), asyncio.get_running_loop())
+    service.start_rabbit_listener()
+    service.start_outbox_relay()
     print("ECG Measurements API started")
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+
 @app.post("/v1/measurements", response_model=Measurement, status_code=201)
 async def create_measurement_from_file(
     file: UploadFile = File(...),
     fs: int = Form(...),
     state: str = Form(...),
     meta: Optional[str] = Form(None),
-    user_id: str = Header(alias="user-id"),
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     try:
@@ -66,6 +83,7 @@ async def create_measurement_from_file(
         measurement_service = MeasurementService(db, asyncio.get_running_loop())
         
         content = await file.read()
+        UPLOAD_BYTES.labels(endpoint="file").observe(len(content))
         
         measurement_id = str(uuid.uuid4())
         measurement = await measurement_service.create_measurement_from_file(
@@ -85,24 +103,31 @@ async def create_measurement_from_file(
 
 @app.post("/v1/measurements/json", response_model=Measurement, status_code=201)
 async def create_measurement_from_json(
-    request: dict,
-    user_id: str = Header(alias="user-id"),
+    request: Request,
+    wait: bool = False,
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     try:
-        if "ecg" not in request or "fs" not in request or "state" not in request:
-            raise HTTPException(status_code=400, detail="ecg, fs, and state are required")
-        
-        ecg_data = request["ecg"]
-        if not isinstance(ecg_data, list) or len(ecg_data) < 10:
+        body = await request.body()
+        UPLOAD_BYTES.labels(endpoint="json").observe(len(body))
+        try:
+            decoded = decode_measurement_body(body, request.headers, request.query_params)
+        except UnsupportedMediaType as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        except WireFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        ecg_data = decoded.ecg
+        if ecg_data.ndim != 1 or len(ecg_data) < 10:
             raise HTTPException(status_code=400, detail="ecg must be an array with at least 10 elements")
         
-        fs = request["fs"]
-        if not isinstance(fs, int) or not (50 <= fs <= 2000):
+        fs = decoded.fs
+        if not isinstance(fs, int) or isinstance(fs, bool) or not (50 <= fs <= 2000):
             raise HTTPException(status_code=400, detail="fs must be an integer between 50 and 2000")
         
         try:
-            state_enum = State(request["state"])
+            state_enum = State(decoded.state)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid state. Must be one of: exercise, rest, daily")
         
@@ -114,8 +139,12 @@ async def create_measurement_from_json(
             ecg_data=ecg_data,
             fs=fs,
             state=state_enum,
-            user_id=user_id
+            user_id=user_id,
+            wait=wait
         )
+        if measurement is None:
+            # deleted while ?wait=true was waiting for the analysis
+            raise HTTPException(status_code=404, detail="Measurement not found")
         
         return measurement
         
@@ -126,7 +155,7 @@ async def create_measurement_from_json(
 
 @app.get("/v1/measurements", response_model=MeasurementList)
 async def get_user_measurements(
-    user_id: str = Header(alias="user-id"),
+    user_id: str = Depends(get_user_id),
     limit: int = 100,
     offset: int = 0,
     db: Session = Depends(get_db)
@@ -134,9 +163,8 @@ async def get_user_measurements(
     measurement_service = MeasurementService(db, asyncio.get_running_loop())
     measurements = measurement_service.get_user_measurements(user_id, limit, offset)
     
-    # Get total count
-    from models import MeasurementDB
-    total = db.query(MeasurementDB).filter(MeasurementDB.user_id == user_id).count()
+    # Total from the per-user counters instead of COUNT(*)
+    total = measurement_service.get_summary(user_id)["total"]
     
     return MeasurementList(
         measurements=measurements,
@@ -145,10 +173,18 @@ async def get_user_measurements(
         offset=offset
     )
 
+@app.get("/v1/measurements/summary", response_model=MeasurementSummary)
+async def get_measurements_summary(
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    measurement_service = MeasurementService(db, asyncio.get_running_loop())
+    return measurement_service.get_summary(user_id)
+
 @app.get("/v1/measurements/{measurement_id}", response_model=Measurement)
 async def get_measurement(
     measurement_id: str,
-    user_id: str = Header(alias="user-id"),
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     measurement_service = MeasurementService(db, asyncio.get_running_loop())
@@ -159,11 +195,70 @@ async def get_measurement(
     
     return measurement
 
+@app.get("/v1/measurements/{measurement_id}/waveform", response_model=Waveform)
+async def get_measurement_waveform(
+    measurement_id: str,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    points: int = WAVEFORM_DEFAULT_POINTS,
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    measurement_service = MeasurementService(db, asyncio.get_running_loop())
+    try:
+        waveform = await measurement_service.get_waveform(measurement_id, user_id, start, end, points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if waveform is None:
+        raise HTTPException(status_code=404, detail="Measurement not found")
+
+    return waveform
+
+@app.get("/v1/measurements/{measurement_id}/timeline", response_model=TimelineSlice)
+async def get_measurement_timeline(
+    measurement_id: str,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    measurement_service = MeasurementService(db, asyncio.get_running_loop())
+    try:
+        timeline = measurement_service.get_timeline(measurement_id, user_id, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if timeline is None:
+        raise HTTPException(status_code=404, detail="Timeline not found")
+
+    return timeline
+
+@app.get("/v1/measurements/{measurement_id}/episodes", response_model=EpisodeList)
+async def get_measurement_episodes(
+    measurement_id: str,
+    label: str,
+    threshold: float = 0.5,
+    min_sec: float = 0.0,
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    measurement_service = MeasurementService(db, asyncio.get_running_loop())
+    try:
+        episodes = measurement_service.get_episodes(measurement_id, user_id, label, threshold, min_sec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if episodes is None:
+        raise HTTPException(status_code=404, detail="Timeline not found")
+
+    return episodes
+
 @app.patch("/v1/measurements/{measurement_id}", response_model=Measurement)
 async def update_measurement(
     measurement_id: str,
     request: dict,
-    user_id: str = Header(alias="user-id"),
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     measurement_service = MeasurementService(db, asyncio.get_running_loop())
@@ -183,6 +278,33 @@ async def update_measurement(
     
     return measurement
 
+@app.post("/v1/measurements/{measurement_id}/cancel", response_model=Measurement)
+async def cancel_measurement(
+    measurement_id: str,
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    measurement_service = MeasurementService(db, asyncio.get_running_loop())
+
+    if not measurement_service.get_measurement(measurement_id, user_id):
+        raise HTTPException(status_code=404, detail="Measurement not found")
+
+    return await measurement_service.cancel_analysis(measurement_id)
+
+@app.delete("/v1/measurements/{measurement_id}", status_code=204)
+async def delete_measurement(
+    measurement_id: str,
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    measurement_service = MeasurementService(db, asyncio.get_running_loop())
+
+    if not measurement_service.get_measurement(measurement_id, user_id):
+        raise HTTPException(status_code=404, detail="Measurement not found")
+
+    measurement_service.delete_measurement(measurement_id)
+    return Response(status_code=204)
+
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
     await websocket_manager.connect(websocket, user_id)
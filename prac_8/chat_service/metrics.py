@@ -0,0 +1,133 @@
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Buckets in seconds for calls inside the service (MinIO, RabbitMQ, DB, WebSocket)
+IO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upload sizes: 1 KiB .. 256 MiB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+# Consumer lag covers queueing + analysis + LLM, up to ANALYSIS_TTL_SEC
+LAG_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 900, 1800)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "chat_http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+UPLOAD_BYTES = Histogram(
+    "chat_upload_size_bytes", "Size of uploaded measurement bodies",
+    ["endpoint"], buckets=SIZE_BUCKETS,
+)
+MINIO_PUT_SECONDS = Histogram(
+    "chat_minio_put_duration_seconds", "Time spent in MinIO put_object", buckets=IO_BUCKETS,
+)
+RABBIT_PUBLISH_SECONDS = Histogram(
+    "chat_rabbitmq_publish_duration_seconds", "Time to publish to RabbitMQ, connection setup included",
+    ["kind"], buckets=IO_BUCKETS,
+)
+ANALYSIS_RPC_SECONDS = Histogram(
+    "chat_analysis_rpc_duration_seconds", "Synchronous fast-path analysis round trip",
+    ["outcome"], buckets=IO_BUCKETS,
+)
+DB_QUERY_SECONDS = Histogram(
+    "chat_db_query_duration_seconds", "SQL statement execution time",
+    ["operation"], buckets=IO_BUCKETS,
+)
+WS_ACTIVE_CONNECTIONS = Gauge(
+    "chat_websocket_active_connections", "Open WebSocket connections",
+)
+WS_SEND_SECONDS = Histogram(
+    "chat_websocket_send_duration_seconds", "Time to send one WebSocket message", buckets=IO_BUCKETS,
+)
+WS_SEND_DROPS = Counter(
+    "chat_websocket_send_drops_total", "WebSocket messages that failed to send (connection dropped)",
+)
+RESULT_LAG_SECONDS = Histogram(
+    "chat_result_lag_seconds", "Time from measurement created_at to the analysis result being applied",
+    ["status"], buckets=LAG_BUCKETS,
+)
+END_TO_END_SECONDS = Histogram(
+    "chat_end_to_end_latency_seconds", "Time from measurement created_at to the result pushed over WebSocket",
+    ["path", "status"], buckets=LAG_BUCKETS,
+)
+WAVEFORM_TILE_REQUESTS = Counter(
+    "chat_waveform_tile_requests_total", "Waveform preview tiles served from the in-process LRU or MinIO",
+    ["result"],
+)
+OUTBOX_PUBLISHED = Counter(
+    "chat_outbox_published_total", "Outbox rows handled by the relay (sent = confirmed by the broker)",
+    ["result"],
+)
+OUTBOX_LAG_SECONDS = Histogram(
+    "chat_outbox_lag_seconds", "Time from an outbox row becoming available to its broker confirm",
+    buckets=IO_BUCKETS,
+)
+
+SQL_OPERATIONS = ("select", "insert", "update", "delete")
+
+
+async def track_requests(request: Request, call_next):
+    """HTTP middleware: latency per route template (not raw path, to keep label cardinality bounded)"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status),
+        ).observe(time.perf_counter() - started)
+
+
+def metrics_response() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument_engine(engine: Engine):
+    """Records every SQL statement into DB_QUERY_SECONDS by operation"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(" ", 1)[0].lower()
+        DB_QUERY_SECONDS.labels(
+            operation=operation if operation in SQL_OPERATIONS else "other"
+        ).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # failed statement never reaches after_cursor_execute
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+
+
+def seconds_since(created_at: Optional[datetime]) -> Optional[float]:
+    if created_at is None:
+        return None
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (datetime.now(tz=timezone.utc) - created_at).total_seconds())
+
+
+def observe_result_lag(created_at: Optional[datetime], status: str):
+    lag = seconds_since(created_at)
+    if lag is not None:
+        RESULT_LAG_SECONDS.labels(status=status).observe(lag)
+
+
+def observe_end_to_end(created_at: Optional[datetime], path: str, status: str):
+    latency = seconds_since(created_at)
+    if latency is not None:
+        END_TO_END_SECONDS.labels(path=path, status=status).observe(latency)
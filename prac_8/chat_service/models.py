@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, Text, Enum as SQLEnum
+from sqlalchemy import (Column, String, Integer, Float, DateTime, Text, Enum as SQLEnum, ForeignKey, Index,
+                        LargeBinary)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from pydantic import BaseModel, Field
@@ -36,6 +37,113 @@ class MeasurementDB(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     llm_answer = Column(Text, nullable=True)
+    model_version = Column(String(100), nullable=True)  # model that produced results
+
+    __table_args__ = (
+        # keyset pagination for bulk re-analysis: ORDER BY created_at, id
+        Index("ix_measurements_created_at_id", "created_at", "id"),
+        # user list ordered by created_at; summary reconciliation per user
+        Index("ix_measurements_user_created_at", "user_id", "created_at"),
+    )
+
+class MeasurementSummaryDB(Base):
+    """Per-user counters, changed in the same transaction as measurements (see summary.py)"""
+    __tablename__ = "measurement_summaries"
+
+    user_id = Column(String(100), primary_key=True)
+    total = Column(Integer, default=0, nullable=False)
+    status_processing = Column(Integer, default=0, nullable=False)
+    status_waiting_user = Column(Integer, default=0, nullable=False)
+    status_done = Column(Integer, default=0, nullable=False)
+    status_error = Column(Integer, default=0, nullable=False)
+    state_exercise = Column(Integer, default=0, nullable=False)
+    state_rest = Column(Integer, default=0, nullable=False)
+    state_daily = Column(Integer, default=0, nullable=False)
+    last_measurement_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class AnalysisOutboxDB(Base):
+    """Analysis messages committed with their measurement, published by outbox.OutboxRelay"""
+    __tablename__ = "analysis_outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    measurement_id = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON analysis message
+    headers = Column(Text, nullable=True)   # JSON W3C trace context of the upload request
+    available_at = Column(DateTime(timezone=True), nullable=False)  # held back / retry backoff until then
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)  # confirmed by the broker
+
+    __table_args__ = (
+        # relay: pending rows in id order; release/discard by measurement
+        Index("ix_analysis_outbox_pending", "sent_at", "available_at", "id"),
+        Index("ix_analysis_outbox_measurement", "measurement_id"),
+    )
+
+class MeasurementTimelineDB(Base):
+    """
+    Per-window probabilities of a measurement, kept out of measurements so list/get stay small.
+    data: uint8 matrix (windows, labels) row-major, p = q / 254, 255 = window not evaluated.
+    """
+    __tablename__ = "measurement_timelines"
+
+    measurement_id = Column(String, ForeignKey("measurements.id", ondelete="CASCADE"), primary_key=True)
+    model_version = Column(String(100), nullable=True)
+    labels = Column(Text, nullable=False)  # JSON list, column order of data
+    win_sec = Column(Float, nullable=False)
+    windows = Column(Integer, nullable=False)
+    encoding = Column(String(10), nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ReanalysisStatus(str, enum.Enum):
+    running = "running"
+    done = "done"          # every selected measurement answered; results not visible yet
+    promoted = "promoted"  # results copied into measurements
+
+class ReanalysisJobDB(Base):
+    """Bulk re-analysis job; cursor + counters make it resumable after a crash"""
+    __tablename__ = "reanalysis_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    model_version = Column(String(100), nullable=True)  # target version, None = worker default
+    status = Column(SQLEnum(ReanalysisStatus), default=ReanalysisStatus.running, nullable=False)
+    filters = Column(Text, nullable=False)  # JSON: created_from/created_to/user_id/status/model_version
+    rate_per_sec = Column(Float, nullable=False)
+    concurrency = Column(Integer, nullable=False)
+    # keyset cursor: last published (created_at, id)
+    cursor_created_at = Column(DateTime(timezone=True), nullable=True)
+    cursor_id = Column(String, nullable=True)
+    published = Column(Integer, default=0, nullable=False)
+    completed = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    promoted_at = Column(DateTime(timezone=True), nullable=True)
+
+class ReanalysisResultStatus(str, enum.Enum):
+    pending = "pending"
+    done = "done"
+    error = "error"
+
+class ReanalysisResultDB(Base):
+    """Versioned results of a re-analysis job, kept apart from measurements.results until promotion"""
+    __tablename__ = "reanalysis_results"
+
+    job_id = Column(String, ForeignKey("reanalysis_jobs.id", ondelete="CASCADE"), primary_key=True)
+    measurement_id = Column(String, primary_key=True)
+    status = Column(SQLEnum(ReanalysisResultStatus), default=ReanalysisResultStatus.pending, nullable=False)
+    model_version = Column(String(100), nullable=True)  # version reported by the worker
+    results = Column(Text, nullable=True)  # JSON string
+    errors = Column(Text, nullable=True)   # JSON string
+    timeline = Column(Text, nullable=True)  # JSON: worker timeline message, written on promotion
+    attempts = Column(Integer, default=1, nullable=False)
+    published_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (Index("ix_reanalysis_results_job_status", "job_id", "status"),)
 
 # Pydantic models for API
 class Measurement(BaseModel):
@@ -50,6 +158,7 @@ class Measurement(BaseModel):
     results: Optional[Dict[str, float]] = None
     errors: Optional[List[str]] = None
     llm_answer: Optional[str] = None
+    model_version: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -68,6 +177,51 @@ class CreateMeasurementFromJsonRequest(BaseModel):
     fs: int = Field(..., ge=50, le=2000)
     state: State
 
+class Waveform(BaseModel):
+    measurement_id: str
+    fs: float
+    start: float
+    end: float
+    duration_sec: float
+    resolution: str  # "raw" (min == max == samples) or "minmax"
+    bucket_sec: float
+    t: List[float]    # bucket start, seconds
+    min: List[float]
+    max: List[float]
+
+class TimelineSlice(BaseModel):
+    measurement_id: str
+    model_version: Optional[str] = None
+    win_sec: float
+    windows: int
+    start: float
+    end: float
+    labels: List[str]
+    t: List[float]  # window start, seconds
+    probabilities: Dict[str, List[Optional[float]]]  # None = window not evaluated
+
+class Episode(BaseModel):
+    start_sec: float
+    end_sec: float
+    windows: int
+    max_prob: float
+    mean_prob: float
+
+class EpisodeList(BaseModel):
+    measurement_id: str
+    model_version: Optional[str] = None
+    label: str
+    threshold: float
+    win_sec: float
+    episodes: List[Episode]
+
+class MeasurementSummary(BaseModel):
+    user_id: str
+    total: int
+    by_status: Dict[str, int]
+    by_state: Dict[str, int]
+    last_measurement_at: Optional[datetime] = None
+
 class MeasurementList(BaseModel):
     measurements: List[Measurement]
     total: int
@@ -0,0 +1,157 @@
+"""
+Transactional outbox for analysis jobs.
+
+Uploads add an analysis_outbox row in the same transaction as the measurement (enqueue), so the
+HTTP response waits for one DB commit and never for the broker. OutboxRelay, a daemon thread of
+every chat_service process, claims pending rows in batches (FOR UPDATE SKIP LOCKED, so replicas do
+not publish the same row), publishes them with publisher confirms and marks them sent. A crash
+between commit and publish only delays the job: the row is still pending after a restart.
+
+Delivery is at least once: a batch that fails half-way is published again as a whole, duplicates
+are ignored by apply_analysis_response (the measurement is no longer processing).
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from metrics import OUTBOX_LAG_SECONDS, OUTBOX_PUBLISHED
+from models import AnalysisOutboxDB
+from tracing import amqp_headers
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+# idle poll; uploads of this process wake the relay at once (notify)
+OUTBOX_POLL_SEC = float(os.getenv("OUTBOX_POLL_SEC", "1"))
+OUTBOX_RETRY_MAX_SEC = float(os.getenv("OUTBOX_RETRY_MAX_SEC", "60"))
+# after a wake-up wait this long so uploads arriving together go out as one batch (one confirm round)
+OUTBOX_LINGER_SEC = float(os.getenv("OUTBOX_LINGER_SEC", "0.02"))
+# sent rows are kept this long for debugging, then purged by the relay
+OUTBOX_RETENTION_SEC = float(os.getenv("OUTBOX_RETENTION_SEC", "3600"))
+PURGE_EVERY_SEC = 60
+
+_wakeup = threading.Event()
+
+
+def enqueue(db: Session, measurement_id: str, message: dict, delay_sec: float = 0.0) -> AnalysisOutboxDB:
+    """
+    Adds the analysis message to the caller's transaction; nothing is published before its commit.
+    delay_sec holds the row back (the ?wait=true fast path answers over RPC first).
+    """
+    row = AnalysisOutboxDB(
+        measurement_id=measurement_id,
+        payload=json.dumps(message),
+        # trace context of the upload request: the relay publishes inside that trace
+        headers=json.dumps(amqp_headers()),
+        available_at=datetime.utcnow() + timedelta(seconds=delay_sec),
+    )
+    db.add(row)
+    return row
+
+
+def notify():
+    """Wake the relay of this process; call after the commit that added outbox rows"""
+    _wakeup.set()
+
+
+def _pending(db: Session, measurement_id: str):
+    return db.query(AnalysisOutboxDB).filter(
+        AnalysisOutboxDB.measurement_id == measurement_id,
+        AnalysisOutboxDB.sent_at.is_(None),
+    )
+
+
+def release(db: Session, measurement_id: str):
+    """Publish a held row now (fast path timed out)"""
+    _pending(db, measurement_id).update({"available_at": datetime.utcnow()}, synchronize_session=False)
+
+
+def discard(db: Session, measurement_id: str):
+    """Drop unsent rows of the measurement (answered over RPC, cancelled or deleted)"""
+    _pending(db, measurement_id).delete(synchronize_session=False)
+
+
+class OutboxRelay:
+    def __init__(self, rabbitmq_service, batch_size: int = OUTBOX_BATCH_SIZE, session_factory=SessionLocal):
+        self.rabbitmq_service = rabbitmq_service
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self._purged_at = 0.0
+
+    def start(self) -> threading.Thread:
+        t = threading.Thread(target=self.run, name="outbox-relay", daemon=True)
+        t.start()
+        return t
+
+    def _claim(self, db: Session) -> List[AnalysisOutboxDB]:
+        return db.query(AnalysisOutboxDB).filter(
+            AnalysisOutboxDB.sent_at.is_(None),
+            AnalysisOutboxDB.available_at <= datetime.utcnow(),
+        ).order_by(AnalysisOutboxDB.id).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+    def relay_once(self) -> int:
+        """Publishes one batch; returns the number of rows marked sent"""
+        db = self.session_factory()
+        try:
+            rows = self._claim(db)
+            if not rows:
+                db.rollback()
+                return 0
+            try:
+                self.rabbitmq_service.publish_outbox_batch(
+                    [json.loads(r.payload) for r in rows],
+                    [json.loads(r.headers) if r.headers else None for r in rows],
+                )
+            except Exception as e:
+                # the broker did not confirm the batch: retry later with backoff, rows stay locked until commit
+                now = datetime.utcnow()
+                for r in rows:
+                    r.attempts += 1
+                    r.last_error = str(e)[:500]
+                    r.available_at = now + timedelta(seconds=min(OUTBOX_RETRY_MAX_SEC, 2 ** r.attempts))
+                db.commit()
+                OUTBOX_PUBLISHED.labels(result="failed").inc(len(rows))
+                print(f"Outbox relay: batch of {len(rows)} not published: {e}")
+                return 0
+
+            now = datetime.utcnow()
+            for r in rows:
+                r.sent_at = now
+                OUTBOX_LAG_SECONDS.observe(max(0.0, (now - r.available_at).total_seconds()))
+            db.commit()
+            OUTBOX_PUBLISHED.labels(result="sent").inc(len(rows))
+            return len(rows)
+        finally:
+            db.close()
+
+    def purge(self) -> int:
+        db = self.session_factory()
+        try:
+            deleted = db.query(AnalysisOutboxDB).filter(
+                AnalysisOutboxDB.sent_at < datetime.utcnow() - timedelta(seconds=OUTBOX_RETENTION_SEC)
+            ).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def run(self):
+        while True:
+            try:
+                sent = self.relay_once()
+                if time.monotonic() - self._purged_at > PURGE_EVERY_SEC:
+                    self._purged_at = time.monotonic()
+                    self.purge()
+            except Exception as e:
+                # DB unavailable etc.: keep the thread alive
+                print(f"Outbox relay: {e}")
+                sent = 0
+            if sent < self.batch_size:
+                # a full batch means more may be pending: only sleep after a partial one
+                if _wakeup.wait(OUTBOX_POLL_SEC):
+                    time.sleep(OUTBOX_LINGER_SEC)
+                _wakeup.clear()
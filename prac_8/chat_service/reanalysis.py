@@ -0,0 +1,407 @@
+"""
+Bulk re-analysis of stored measurements, e.g. after new model weights are published.
+
+    python reanalysis.py start --model-version v2 [--from 2025-01-01] [--to 2025-02-01] [--user-id u1]
+                               [--status done] [--source-model-version v1|none] [--rate 10] [--concurrency 50]
+    python reanalysis.py resume <job_id>
+    python reanalysis.py status [<job_id>]
+    python reanalysis.py promote <job_id> [--force]
+
+Measurements are paged by keyset (created_at, id) and published in batches with publisher confirms,
+at most --rate messages per second and --concurrency unanswered jobs at a time. Replies go to a
+dedicated queue and land in reanalysis_results; users keep seeing measurements.results until the
+job is promoted. The cursor and counters live in reanalysis_jobs, so a crashed run is resumed with
+`resume`: confirmed-but-uncommitted batches are simply published again (results are idempotent).
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, init_db
+from models import (MeasurementDB, MeasurementTimelineDB, ReanalysisJobDB, ReanalysisResultDB, ReanalysisResultStatus,
+                    ReanalysisStatus, Status)
+from services import ANALYSIS_TTL_SEC, CSV_BYTES_PER_SAMPLE, MinIOService, RabbitMQService
+from summary import record_status
+from timeline import timeline_from_message
+
+REANALYSIS_RESPONSE_QUEUE = os.getenv("REANALYSIS_RESPONSE_QUEUE", "ecg_reanalysis_responses")
+REANALYSIS_RATE_PER_SEC = float(os.getenv("REANALYSIS_RATE_PER_SEC", "10"))
+REANALYSIS_CONCURRENCY = int(os.getenv("REANALYSIS_CONCURRENCY", "50"))
+REANALYSIS_BATCH_SIZE = int(os.getenv("REANALYSIS_BATCH_SIZE", "50"))
+# unanswered after ANALYSIS_TTL_SEC = expired in the broker; republished up to this many times
+REANALYSIS_MAX_ATTEMPTS = int(os.getenv("REANALYSIS_MAX_ATTEMPTS", "3"))
+POLL_SEC = 1.0
+PROMOTE_BATCH_SIZE = 500
+
+
+class RateLimiter:
+    """Token bucket; a batch may take the bucket into debt, the next acquire waits it out"""
+
+    def __init__(self, rate_per_sec: float):
+        self.rate = rate_per_sec
+        self.capacity = max(1.0, rate_per_sec)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def acquire(self, n: int = 1):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < n:
+            time.sleep((n - self.tokens) / self.rate)
+            self.tokens = float(n)
+            self.updated = time.monotonic()
+        self.tokens -= n
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def select_measurements(db: Session, filters: dict):
+    """Measurements matching job filters (only those with a stored recording)"""
+    query = db.query(MeasurementDB).filter(MeasurementDB.ecg_file_url.isnot(None))
+    if filters.get("created_from"):
+        query = query.filter(MeasurementDB.created_at >= _parse_time(filters["created_from"]))
+    if filters.get("created_to"):
+        query = query.filter(MeasurementDB.created_at < _parse_time(filters["created_to"]))
+    if filters.get("user_id"):
+        query = query.filter(MeasurementDB.user_id == filters["user_id"])
+    if filters.get("status"):
+        query = query.filter(MeasurementDB.status == Status(filters["status"]))
+    if filters.get("model_version") == "none":
+        query = query.filter(MeasurementDB.model_version.is_(None))
+    elif filters.get("model_version"):
+        query = query.filter(MeasurementDB.model_version == filters["model_version"])
+    return query
+
+
+def create_job(db: Session, model_version: Optional[str], filters: dict,
+               rate_per_sec: float = REANALYSIS_RATE_PER_SEC,
+               concurrency: int = REANALYSIS_CONCURRENCY) -> ReanalysisJobDB:
+    # without an upper bound the job would chase new uploads forever
+    filters = {**filters, "created_to": filters.get("created_to") or datetime.utcnow().isoformat()}
+    job = ReanalysisJobDB(model_version=model_version, filters=json.dumps(filters),
+                          rate_per_sec=rate_per_sec, concurrency=concurrency)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def apply_reanalysis_response(db: Session, job_id: str, measurement_id: str, resp: dict) -> bool:
+    """Stores a worker reply in reanalysis_results; duplicates and late replies are ignored"""
+    ok = resp.get("status") == "ok"
+    values = {
+        "status": ReanalysisResultStatus.done if ok else ReanalysisResultStatus.error,
+        "model_version": resp.get("model_version"),
+        "updated_at": datetime.utcnow(),
+    }
+    if ok:
+        values["results"] = json.dumps(resp.get("features", {}))
+        if resp.get("timeline"):
+            values["timeline"] = json.dumps(resp["timeline"])
+    else:
+        values["errors"] = json.dumps([resp.get("error", "unknown error")])
+    # conditional update: only the first reply for a pending row counts
+    updated = db.execute(
+        update(ReanalysisResultDB)
+        .where(ReanalysisResultDB.job_id == job_id,
+               ReanalysisResultDB.measurement_id == measurement_id,
+               ReanalysisResultDB.status == ReanalysisResultStatus.pending)
+        .values(**values)
+    ).rowcount
+    if updated:
+        counter = ReanalysisJobDB.completed if ok else ReanalysisJobDB.failed
+        db.execute(update(ReanalysisJobDB).where(ReanalysisJobDB.id == job_id).values({counter: counter + 1}))
+    db.commit()
+    return bool(updated)
+
+
+def handle_reanalysis_reply(ch, method, props, body: bytes):
+    try:
+        resp = json.loads(body.decode("utf-8"))
+        job_id, measurement_id = (props.correlation_id or "").split(":", 1)
+    except ValueError as e:
+        print(f"Invalid re-analysis reply: {e}")
+        return
+    db = SessionLocal()
+    try:
+        apply_reanalysis_response(db, job_id, measurement_id, resp)
+    finally:
+        db.close()
+
+
+def promote_job(db: Session, job_id: str, force: bool = False) -> int:
+    """
+    Copies successful results of the job into measurements (results + model_version).
+    Measurements being analysed right now are left alone. Returns number of promoted measurements.
+    """
+    job = db.get(ReanalysisJobDB, job_id)
+    if job is None:
+        raise LookupError(f"Re-analysis job {job_id} not found")
+    if job.status == ReanalysisStatus.promoted:
+        return 0
+    if job.status != ReanalysisStatus.done and not force:
+        raise RuntimeError(f"Job {job_id} is {job.status.value}; wait for it to finish or use --force")
+
+    promoted, last_id = 0, ""
+    while True:
+        rows = db.query(ReanalysisResultDB).filter(
+            ReanalysisResultDB.job_id == job_id,
+            ReanalysisResultDB.status == ReanalysisResultStatus.done,
+            ReanalysisResultDB.measurement_id > last_id,
+        ).order_by(ReanalysisResultDB.measurement_id).limit(PROMOTE_BATCH_SIZE).all()
+        if not rows:
+            break
+        # previous status per measurement, for the summary counters
+        current = {m_id: (user_id, status) for m_id, user_id, status in db.query(
+            MeasurementDB.id, MeasurementDB.user_id, MeasurementDB.status
+        ).filter(MeasurementDB.id.in_([row.measurement_id for row in rows]))}
+        for row in rows:
+            updated = db.execute(
+                update(MeasurementDB)
+                .where(MeasurementDB.id == row.measurement_id, MeasurementDB.status != Status.processing)
+                .values(results=row.results, model_version=row.model_version, status=Status.done,
+                        errors=None, updated_at=datetime.utcnow())
+            ).rowcount
+            if updated:
+                record_status(db, *current[row.measurement_id], Status.done)
+                # the old timeline belongs to the old results
+                db.query(MeasurementTimelineDB).filter(
+                    MeasurementTimelineDB.measurement_id == row.measurement_id
+                ).delete(synchronize_session=False)
+                if row.timeline:
+                    db.merge(timeline_from_message(row.measurement_id, row.model_version, json.loads(row.timeline)))
+            promoted += updated
+        last_id = rows[-1].measurement_id
+        db.commit()
+
+    job.status = ReanalysisStatus.promoted
+    job.promoted_at = datetime.utcnow()
+    db.commit()
+    return promoted
+
+
+def job_progress(db: Session, job: ReanalysisJobDB) -> dict:
+    pending = db.query(ReanalysisResultDB).filter(
+        ReanalysisResultDB.job_id == job.id, ReanalysisResultDB.status == ReanalysisResultStatus.pending
+    ).count()
+    return {
+        "id": job.id,
+        "status": job.status.value,
+        "model_version": job.model_version,
+        "filters": json.loads(job.filters),
+        "published": job.published,
+        "completed": job.completed,
+        "failed": job.failed,
+        "in_flight": pending,
+        "cursor": [job.cursor_created_at.isoformat() if job.cursor_created_at else None, job.cursor_id],
+    }
+
+
+class ReanalysisRunner:
+    """Publishes one job under its rate/concurrency limits and consumes the replies until it is done"""
+
+    def __init__(self, job_id: str, batch_size: int = REANALYSIS_BATCH_SIZE):
+        self.job_id = job_id
+        self.batch_size = batch_size
+        self.rabbitmq_service = RabbitMQService()
+        self.minio_service = MinIOService()
+        self.db = SessionLocal()
+
+    def _job(self) -> ReanalysisJobDB:
+        self.db.expire_all()
+        return self.db.get(ReanalysisJobDB, self.job_id)
+
+    def _pending(self):
+        return self.db.query(ReanalysisResultDB).filter(
+            ReanalysisResultDB.job_id == self.job_id,
+            ReanalysisResultDB.status == ReanalysisResultStatus.pending,
+        )
+
+    def _next_page(self, job: ReanalysisJobDB, limit: int) -> List[MeasurementDB]:
+        query = select_measurements(self.db, json.loads(job.filters))
+        if job.cursor_id is not None:
+            # created_at of the cursor row as stored: a bound datetime is rendered differently on SQLite
+            # ('... 20:15:35.000000' vs '... 20:15:35') and would skip rows sharing the cursor's second;
+            # the saved value is only used if the cursor measurement has been deleted since
+            cursor_created_at = func.coalesce(
+                select(MeasurementDB.created_at).where(MeasurementDB.id == job.cursor_id).scalar_subquery(),
+                job.cursor_created_at,
+            )
+            query = query.filter(tuple_(MeasurementDB.created_at, MeasurementDB.id)
+                                 > tuple_(cursor_created_at, job.cursor_id))
+        return query.order_by(MeasurementDB.created_at, MeasurementDB.id).limit(limit).all()
+
+    def _message(self, job: ReanalysisJobDB, m: MeasurementDB) -> dict:
+        object_name = m.ecg_file_url.rsplit("/", 1)[-1]
+        if m.duration_sec:
+            samples = int(m.duration_sec * m.fs)
+        else:
+            size = self.minio_service.object_size(object_name)
+            samples = size // 4 if m.format == "npy" else size // CSV_BYTES_PER_SAMPLE
+        message = {
+            "measurement_id": m.id,
+            "correlation_id": f"{job.id}:{m.id}",
+            "bucket": self.minio_service.bucket,
+            "object_name": object_name,
+            "format": m.format,
+            "fs": m.fs,
+            "duration_sec": m.duration_sec,
+            "estimated_samples": samples,
+            "lane": self.rabbitmq_service.lane_for(samples),
+            "skip_llm": True,
+        }
+        if job.model_version:
+            message["model_version"] = job.model_version
+        return message
+
+    def _publish(self, messages: List[dict]):
+        self.limiter.acquire(len(messages))
+        self.rabbitmq_service.publish_confirmed_batch(messages, REANALYSIS_RESPONSE_QUEUE)
+
+    def _publish_page(self, job: ReanalysisJobDB, page: List[MeasurementDB]):
+        self._publish([self._message(job, m) for m in page])
+        # after the broker confirmed the batch: pending rows + cursor in one transaction
+        now = datetime.utcnow()
+        for m in page:
+            self.db.merge(ReanalysisResultDB(job_id=job.id, measurement_id=m.id,
+                                             status=ReanalysisResultStatus.pending, published_at=now))
+        self.db.execute(update(ReanalysisJobDB).where(ReanalysisJobDB.id == job.id).values(
+            cursor_created_at=page[-1].created_at, cursor_id=page[-1].id,
+            published=ReanalysisJobDB.published + len(page),
+        ))
+        self.db.commit()
+
+    def _fail(self, job: ReanalysisJobDB, row: ReanalysisResultDB, error: str):
+        self.db.execute(update(ReanalysisResultDB).where(
+            ReanalysisResultDB.job_id == job.id, ReanalysisResultDB.measurement_id == row.measurement_id,
+            ReanalysisResultDB.status == ReanalysisResultStatus.pending,
+        ).values(status=ReanalysisResultStatus.error, errors=json.dumps([error])))
+        self.db.execute(update(ReanalysisJobDB).where(ReanalysisJobDB.id == job.id)
+                        .values(failed=ReanalysisJobDB.failed + 1))
+
+    def _retry_expired(self, job: ReanalysisJobDB):
+        # the broker dropped messages older than the TTL: publish again or give up
+        expired = self._pending().filter(
+            ReanalysisResultDB.published_at < datetime.utcnow() - timedelta(seconds=ANALYSIS_TTL_SEC)
+        ).limit(self.batch_size).all()
+        if not expired:
+            return
+        retry = [r for r in expired if r.attempts < REANALYSIS_MAX_ATTEMPTS]
+        for row in expired:
+            if row.attempts >= REANALYSIS_MAX_ATTEMPTS:
+                self._fail(job, row, "timeout")
+        measurements = {m.id: m for m in self.db.query(MeasurementDB).filter(
+            MeasurementDB.id.in_([r.measurement_id for r in retry]))}
+        for row in retry:
+            if row.measurement_id not in measurements:
+                # deleted since it was published: nothing to re-analyse, must not stay pending
+                self._fail(job, row, "measurement deleted")
+        retry = [r for r in retry if r.measurement_id in measurements]
+        if retry:
+            self._publish([self._message(job, measurements[r.measurement_id]) for r in retry])
+            now = datetime.utcnow()
+            for row in retry:
+                row.attempts += 1
+                row.published_at = now
+        self.db.commit()
+
+    def run(self):
+        job = self._job()
+        if job is None:
+            raise LookupError(f"Re-analysis job {self.job_id} not found")
+        if job.status != ReanalysisStatus.running:
+            print(f"Job {job.id} is already {job.status.value}")
+            return
+        self.limiter = RateLimiter(job.rate_per_sec)
+
+        threading.Thread(
+            target=self.rabbitmq_service.start_response_consumer,
+            args=(handle_reanalysis_reply, REANALYSIS_RESPONSE_QUEUE),
+            name="reanalysis-replies",
+            daemon=True,
+        ).start()
+
+        exhausted = False
+        while True:
+            job = self._job()
+            self._retry_expired(job)
+            free = job.concurrency - self._pending().count()
+            if free <= 0:
+                time.sleep(POLL_SEC)
+                continue
+            page = [] if exhausted else self._next_page(job, min(self.batch_size, free))
+            if page:
+                self._publish_page(job, page)
+                job = self._job()
+                print(f"published {job.published}, completed {job.completed}, failed {job.failed}")
+                continue
+            exhausted = True
+            if self._pending().count() == 0:
+                job.status = ReanalysisStatus.done
+                self.db.commit()
+                print(f"Job {job.id} done: {job.completed} completed, {job.failed} failed; "
+                      f"run `promote {job.id}` to publish the results")
+                return
+            time.sleep(POLL_SEC)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk re-analysis of stored ECG measurements")
+    sub = parser.add_subparsers(dest="command", required=True)
+    start = sub.add_parser("start")
+    start.add_argument("--model-version", help="target model version (default: worker default)")
+    start.add_argument("--from", dest="created_from", help="created_at >= (ISO date)")
+    start.add_argument("--to", dest="created_to", help="created_at < (ISO date), default: now")
+    start.add_argument("--user-id")
+    start.add_argument("--status", choices=[s.value for s in Status])
+    start.add_argument("--source-model-version", help="model version of current results, 'none' for legacy rows")
+    start.add_argument("--rate", type=float, default=REANALYSIS_RATE_PER_SEC, help="messages per second")
+    start.add_argument("--concurrency", type=int, default=REANALYSIS_CONCURRENCY, help="max unanswered jobs")
+    sub.add_parser("resume").add_argument("job_id")
+    sub.add_parser("status").add_argument("job_id", nargs="?")
+    promote = sub.add_parser("promote")
+    promote.add_argument("job_id")
+    promote.add_argument("--force", action="store_true", help="promote finished results of an unfinished job")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.command == "start":
+            filters = {
+                "created_from": args.created_from,
+                "created_to": args.created_to,
+                "user_id": args.user_id,
+                "status": args.status,
+                "model_version": args.source_model_version,
+            }
+            job = create_job(db, args.model_version, {k: v for k, v in filters.items() if v},
+                             args.rate, args.concurrency)
+            print(f"Created re-analysis job {job.id}")
+            ReanalysisRunner(job.id).run()
+        elif args.command == "resume":
+            ReanalysisRunner(args.job_id).run()
+        elif args.command == "status":
+            query = db.query(ReanalysisJobDB)
+            if args.job_id:
+                query = query.filter(ReanalysisJobDB.id == args.job_id)
+            for job in query.order_by(ReanalysisJobDB.created_at).all():
+                print(json.dumps(job_progress(db, job), ensure_ascii=False))
+        elif args.command == "promote":
+            print(f"Promoted {promote_job(db, args.job_id, args.force)} measurements")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
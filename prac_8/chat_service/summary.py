@@ -0,0 +1,156 @@
+"""
+Per-user measurement counters (measurement_summaries) for GET /v1/measurements/summary.
+
+Every insert, delete, status and state change of a measurement adds +1/-1 to the user's row with
+`col = col + delta` in the same transaction, so reads are a primary-key lookup instead of
+COUNT(*) ... GROUP BY. Counters can still drift (racing transitions, manual SQL); the reconcile
+job recomputes them:
+
+    python summary.py reconcile [--user-id u1]
+"""
+import argparse
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from models import MeasurementDB, MeasurementSummaryDB, State, Status
+
+STATUS_COLUMNS = {status: f"status_{status.value}" for status in Status}
+STATE_COLUMNS = {state: f"state_{state.value}" for state in State}
+
+
+def _insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(MeasurementSummaryDB)
+
+
+def _apply(db: Session, user_id: str, deltas: dict, **values):
+    """Atomic increments of the user's counters; the row is created on first use"""
+    deltas = {col: delta for col, delta in deltas.items() if delta}
+    if not deltas and not values:
+        return
+    db.execute(_insert(db).values(user_id=user_id).on_conflict_do_nothing(index_elements=["user_id"]))
+    columns = {col: getattr(MeasurementSummaryDB, col) + delta for col, delta in deltas.items()}
+    db.execute(update(MeasurementSummaryDB).where(MeasurementSummaryDB.user_id == user_id)
+               .values(**columns, **values))
+
+
+def _add(deltas: dict, column: Optional[str], delta: int):
+    if column:
+        deltas[column] = deltas.get(column, 0) + delta
+
+
+def record_created(db: Session, measurement: MeasurementDB):
+    deltas = {"total": 1}
+    _add(deltas, STATUS_COLUMNS.get(measurement.status), 1)
+    _add(deltas, STATE_COLUMNS.get(measurement.state), 1)
+    # now() is the transaction time in PostgreSQL, same as the new row's created_at
+    _apply(db, measurement.user_id, deltas, last_measurement_at=func.now())
+
+
+def record_deleted(db: Session, measurement: MeasurementDB):
+    """Call after the row is deleted (flushed): last_measurement_at is recomputed from the rest"""
+    deltas = {"total": -1}
+    _add(deltas, STATUS_COLUMNS.get(measurement.status), -1)
+    _add(deltas, STATE_COLUMNS.get(measurement.state), -1)
+    last = select(func.max(MeasurementDB.created_at)).where(
+        MeasurementDB.user_id == measurement.user_id
+    ).scalar_subquery()
+    _apply(db, measurement.user_id, deltas, last_measurement_at=last)
+
+
+def record_status(db: Session, user_id: str, old: Optional[Status], new: Optional[Status]):
+    if old == new:
+        return
+    deltas = {}
+    _add(deltas, STATUS_COLUMNS.get(old), -1)
+    _add(deltas, STATUS_COLUMNS.get(new), 1)
+    _apply(db, user_id, deltas)
+
+
+def record_state(db: Session, user_id: str, old: Optional[State], new: Optional[State]):
+    if old == new:
+        return
+    deltas = {}
+    _add(deltas, STATE_COLUMNS.get(old), -1)
+    _add(deltas, STATE_COLUMNS.get(new), 1)
+    _apply(db, user_id, deltas)
+
+
+def summary_to_dict(user_id: str, row: Optional[MeasurementSummaryDB]) -> dict:
+    return {
+        "user_id": user_id,
+        "total": row.total if row else 0,
+        "by_status": {s.value: getattr(row, col) if row else 0 for s, col in STATUS_COLUMNS.items()},
+        "by_state": {s.value: getattr(row, col) if row else 0 for s, col in STATE_COLUMNS.items()},
+        "last_measurement_at": row.last_measurement_at if row else None,
+    }
+
+
+def get_summary(db: Session, user_id: str) -> dict:
+    return summary_to_dict(user_id, db.get(MeasurementSummaryDB, user_id))
+
+
+def _expected(db: Session, user_id: str) -> dict:
+    expected = {col: 0 for col in ["total", *STATUS_COLUMNS.values(), *STATE_COLUMNS.values()]}
+    expected["last_measurement_at"] = None
+    rows = db.query(MeasurementDB.status, MeasurementDB.state, func.count(), func.max(MeasurementDB.created_at)) \
+        .filter(MeasurementDB.user_id == user_id) \
+        .group_by(MeasurementDB.status, MeasurementDB.state).all()
+    for status, state, count, last in rows:
+        expected["total"] += count
+        _add(expected, STATUS_COLUMNS.get(status), count)
+        _add(expected, STATE_COLUMNS.get(state), count)
+        if last is not None and (expected["last_measurement_at"] is None or last > expected["last_measurement_at"]):
+            expected["last_measurement_at"] = last
+    return expected
+
+
+def reconcile(db: Session, user_ids: Optional[Iterable[str]] = None) -> int:
+    """
+    Recomputes counters of the given users (default: everyone with measurements or a summary row).
+    The summary row is locked first: a concurrent insert either committed before the count
+    (and is counted) or waits for the lock and applies its +1 on top. Returns number of repaired rows.
+    """
+    if user_ids is None:
+        user_ids = sorted({u for (u,) in db.query(MeasurementDB.user_id).distinct()}
+                          | {u for (u,) in db.query(MeasurementSummaryDB.user_id)})
+    repaired = 0
+    for user_id in user_ids:
+        db.execute(_insert(db).values(user_id=user_id).on_conflict_do_nothing(index_elements=["user_id"]))
+        row = db.query(MeasurementSummaryDB).filter(MeasurementSummaryDB.user_id == user_id) \
+            .with_for_update().populate_existing().one()
+        expected = _expected(db, user_id)
+        drift = {col: value for col, value in expected.items() if getattr(row, col) != value}
+        if drift:
+            for col, value in drift.items():
+                setattr(row, col, value)
+            repaired += 1
+            print(f"Repaired summary of {user_id}: {sorted(drift)}")
+        db.commit()
+    return repaired
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-user measurement summary counters")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("reconcile").add_argument("--user-id", action="append", help="repeatable; default: all users")
+    args = parser.parse_args()
+
+    from database import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.command == "reconcile":
+            print(f"Repaired {reconcile(db, args.user_id)} summaries")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+# service modules are imported the way main.py does (from services import ...); DB is a temporary SQLite file
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "chat_test.db")
+
+import pika
+import pytest
+
+import services
+from database import Base, SessionLocal, engine
+from models import MeasurementDB, Status
+
+
+class FakeChannel:
+    """Local stand-in for a pika channel: publishes are recorded by the broker, the rest is a no-op"""
+
+    def __init__(self, broker: "FakeBroker"):
+        self.broker = broker
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.broker.published.append((exchange, routing_key, json.loads(body), properties))
+
+    def __getattr__(self, name):
+        # exchange_declare, queue_declare, confirm_delivery, ...
+        return lambda *args, **kwargs: None
+
+
+class FakeBroker:
+    """Replaces pika.BlockingConnection: every connection publishes into the same list"""
+
+    def __init__(self):
+        self.published = []
+
+    def __call__(self, parameters=None):
+        return self
+
+    def channel(self):
+        return FakeChannel(self)
+
+    def close(self):
+        pass
+
+    def to_exchange(self, exchange: str) -> list:
+        return [body for ex, _, body, _ in self.published if ex == exchange]
+
+    def cancelled(self) -> list:
+        return [body["measurement_id"] for body in self.to_exchange(os.getenv("CANCEL_EXCHANGE", "ecg_cancel"))]
+
+
+class LocalMinIOService:
+    """MinIOService over a dict, no server needed"""
+
+    def __init__(self):
+        self.endpoint = "local"
+        self.bucket = "ecg-bucket"
+        self.objects = {}
+
+    def upload_file(self, object_name: str, file_content: bytes, content_type: str = "application/octet-stream") -> str:
+        self.objects[object_name] = bytes(file_content)
+        return f"{self.endpoint}/{self.bucket}/{object_name}"
+
+    def remove_file(self, object_name: str):
+        self.objects.pop(object_name, None)
+
+    def object_size(self, object_name: str) -> int:
+        return len(self.objects[object_name])
+
+    def read_file(self, object_name: str, offset: int = 0, length: int = 0) -> bytes:
+        data = self.objects[object_name]
+        return data[offset:offset + length] if length else data[offset:]
+
+
+# MeasurementService creates its MinIOService per request: swap the class before anything imports it
+services.MinIOService = LocalMinIOService
+
+
+@pytest.fixture(autouse=True)
+def broker(monkeypatch):
+    fake = FakeBroker()
+    monkeypatch.setattr(pika, "BlockingConnection", fake)
+    return fake
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def service(db):
+    loop = asyncio.new_event_loop()
+    try:
+        yield services.MeasurementService(db, loop)
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def make_measurement(db):
+    def make(status: Status = Status.processing, user_id: str = "user-1", **fields) -> MeasurementDB:
+        m = MeasurementDB(status=status, fs=200, format="npy", duration_sec=10.0, user_id=user_id, **fields)
+        db.add(m)
+        db.commit()
+        return m
+
+    return make
@@ -0,0 +1,37 @@
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+import auth
+
+
+def client_with(monkeypatch, fetch):
+    client = auth.JWKSClient("http://auth_service:8000/.well-known/jwks.json")
+    monkeypatch.setattr(client, "_fetch", lambda: fetch(client))
+    monkeypatch.setattr(auth, "jwks_client", client)
+    return client
+
+
+def token() -> str:
+    return jwt.encode({"sub": "user-1"}, "secret", algorithm="HS256")
+
+
+def test_jwks_fetch_failure_is_503(monkeypatch):
+    def fetch(client):
+        raise OSError("connection refused")
+
+    client_with(monkeypatch, fetch)
+    with pytest.raises(HTTPException) as e:
+        auth.get_user_id(authorization=f"Bearer {token()}", user_id=None)
+    assert e.value.status_code == 503
+
+
+def test_empty_jwks_falls_back_to_user_id_header(monkeypatch):
+    def fetch(client):
+        client._jwks = {"keys": []}
+
+    client_with(monkeypatch, fetch)
+    assert auth.get_user_id(authorization=f"Bearer {token()}", user_id="user-1") == "user-1"
+    with pytest.raises(HTTPException) as e:
+        auth.get_user_id(authorization=f"Bearer {token()}", user_id=None)
+    assert e.value.status_code == 401
@@ -0,0 +1,87 @@
+import json
+
+from database import SessionLocal
+from models import MeasurementDB, Status
+from services import MeasurementService
+
+
+def run(service, coro):
+    return service.loop.run_until_complete(coro)
+
+
+def test_cancel_processing_publishes_cancel_and_marks_error(db, service, broker, make_measurement):
+    m = make_measurement(Status.processing)
+
+    result = run(service, service.cancel_analysis(m.id))
+
+    assert broker.cancelled() == [m.id]
+    assert result.status == Status.error.value
+    db.expire_all()
+    assert json.loads(db.get(MeasurementDB, m.id).errors) == ["cancelled"]
+
+
+def test_cancel_finished_measurement_is_noop(db, service, broker, make_measurement):
+    m = make_measurement(Status.done, results=json.dumps({"AF": 0.1}))
+
+    result = run(service, service.cancel_analysis(m.id))
+
+    assert broker.cancelled() == []
+    assert result.status == Status.done.value
+
+
+def test_cancel_unknown_measurement(service, broker):
+    assert run(service, service.cancel_analysis("missing")) is None
+    assert broker.cancelled() == []
+
+
+def test_delete_processing_publishes_cancel(db, service, broker, make_measurement):
+    m = make_measurement(Status.processing)
+
+    assert service.delete_measurement(m.id) is True
+
+    assert broker.cancelled() == [m.id]
+    assert db.get(MeasurementDB, m.id) is None
+
+
+def test_delete_finished_does_not_publish_cancel(db, service, broker, make_measurement):
+    m = make_measurement(Status.error)
+
+    assert service.delete_measurement(m.id) is True
+
+    assert broker.cancelled() == []
+    assert db.get(MeasurementDB, m.id) is None
+
+
+def test_late_response_after_cancel_is_ignored(db, service, broker, make_measurement):
+    m = make_measurement(Status.processing)
+    run(service, service.cancel_analysis(m.id))
+
+    assert service.apply_analysis_response(m.id, {"status": "ok", "features": {"AF": 0.9}}) is None
+    db.expire_all()
+    assert db.get(MeasurementDB, m.id).status == Status.error
+    assert db.get(MeasurementDB, m.id).results is None
+
+
+def test_reply_racing_a_cancel_does_not_overwrite_it(db, service, make_measurement):
+    m = make_measurement(Status.processing)
+    assert db.get(MeasurementDB, m.id).status == Status.processing  # loaded by the reply's session
+    other = SessionLocal()
+    run(service, MeasurementService(other, service.loop).cancel_analysis(m.id))
+    other.close()
+
+    assert service.apply_analysis_response(m.id, {"status": "ok", "features": {"AF": 0.9}}) is None
+    db.expire_all()
+    assert db.get(MeasurementDB, m.id).status == Status.error
+
+
+def test_cancel_racing_a_reply_is_noop(db, service, broker, make_measurement):
+    m = make_measurement(Status.processing)
+    assert db.get(MeasurementDB, m.id).status == Status.processing  # loaded by the cancel's session
+    other = SessionLocal()
+    MeasurementService(other, service.loop).apply_analysis_response(m.id, {"status": "ok", "features": {}})
+    other.close()
+
+    result = run(service, service.cancel_analysis(m.id))
+
+    assert result.status == Status.done.value
+    assert broker.cancelled() == []
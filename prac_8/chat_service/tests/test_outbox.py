@@ -0,0 +1,63 @@
+import numpy as np
+
+from database import SessionLocal
+from models import AnalysisOutboxDB, MeasurementDB, State, Status
+import outbox
+
+
+def run(service, coro):
+    return service.loop.run_until_complete(coro)
+
+
+def test_cancel_discards_unsent_job(db, service, make_measurement):
+    m = make_measurement(Status.processing)
+    outbox.enqueue(db, m.id, {"measurement_id": m.id})
+    db.commit()
+
+    run(service, service.cancel_analysis(m.id))
+
+    # the job has not been relayed yet: it is dropped instead of published
+    assert db.query(AnalysisOutboxDB).count() == 0
+
+
+def test_delete_discards_unsent_job(db, service, make_measurement):
+    m = make_measurement(Status.processing)
+    outbox.enqueue(db, m.id, {"measurement_id": m.id})
+    db.commit()
+
+    service.delete_measurement(m.id)
+
+    assert db.query(AnalysisOutboxDB).count() == 0
+
+
+def test_fast_path_reply_after_cancel_returns_stored_measurement(db, service, monkeypatch):
+    def call_analysis(message, timeout):
+        # another request cancels the measurement while ?wait=true is waiting for the reply
+        other = SessionLocal()
+        other.get(MeasurementDB, message["measurement_id"]).status = Status.error
+        other.commit()
+        other.close()
+        return {"status": "ok", "features": {"AF": 0.9}, "measurement_id": message["measurement_id"]}
+
+    monkeypatch.setattr(service.rabbitmq_service, "call_analysis", call_analysis)
+
+    result = run(service, service.create_measurement_from_json(
+        "m-fast", np.zeros(2000, dtype=np.float32), fs=200, state=State.rest, user_id="user-1", wait=True))
+
+    assert result.status == Status.error.value
+    assert result.results is None
+    # the held job is dropped for good, not published after the hold expires
+    db.expire_all()
+    assert db.query(AnalysisOutboxDB).count() == 0
+
+
+def test_relay_publishes_pending_jobs(db, service, broker, make_measurement):
+    m = make_measurement(Status.processing)
+    outbox.enqueue(db, m.id, {"measurement_id": m.id, "lane": "short"})
+    db.commit()
+
+    assert outbox.OutboxRelay(service.rabbitmq_service).relay_once() == 1
+
+    assert [body["measurement_id"] for _, _, body, _ in broker.published] == [m.id]
+    db.expire_all()
+    assert db.query(AnalysisOutboxDB).one().sent_at is not None
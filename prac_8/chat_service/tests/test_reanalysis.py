@@ -0,0 +1,53 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import literal_column
+
+from models import ReanalysisResultDB, ReanalysisResultStatus, Status
+from reanalysis import RateLimiter, ReanalysisRunner, create_job
+from services import ANALYSIS_TTL_SEC
+
+
+def runner_for(job, batch_size: int) -> ReanalysisRunner:
+    runner = ReanalysisRunner(job.id, batch_size=batch_size)
+    runner.limiter = RateLimiter(1e6)
+    return runner
+
+
+def test_pages_rows_sharing_created_at(db, make_measurement):
+    # server-side timestamp with whole seconds, as func.now() stores it on SQLite
+    same_second = literal_column("'2026-01-01 12:00:00'")
+    ids = {make_measurement(Status.done, created_at=same_second, ecg_file_url=f"memory/ecg-bucket/{i}.npy").id
+           for i in range(7)}
+    job = create_job(db, "v2", {"created_to": "2027-01-01T00:00:00"})
+    runner = runner_for(job, batch_size=2)
+
+    published = []
+    while True:
+        job = runner._job()
+        page = runner._next_page(job, runner.batch_size)
+        if not page:
+            break
+        runner._publish_page(job, page)
+        published += [m.id for m in page]
+
+    assert sorted(published) == sorted(ids)
+    assert runner._job().published == 7
+
+
+def test_expired_job_of_deleted_measurement_fails(db, service, make_measurement):
+    m = make_measurement(Status.done, ecg_file_url="memory/ecg-bucket/m.npy")
+    job = create_job(db, "v2", {})
+    db.add(ReanalysisResultDB(job_id=job.id, measurement_id=m.id, status=ReanalysisResultStatus.pending,
+                              published_at=datetime.utcnow() - timedelta(seconds=ANALYSIS_TTL_SEC + 1)))
+    db.commit()
+    service.delete_measurement(m.id)
+    runner = runner_for(job, batch_size=10)
+
+    runner._retry_expired(runner._job())
+
+    assert runner._pending().count() == 0
+    row = runner.db.query(ReanalysisResultDB).one()
+    assert row.status == ReanalysisResultStatus.error
+    assert json.loads(row.errors) == ["measurement deleted"]
+    assert runner._job().failed == 1
@@ -0,0 +1,27 @@
+from database import SessionLocal
+from models import MeasurementDB, MeasurementSummaryDB, Status
+from services import MeasurementService
+from summary import record_created
+
+
+def counters(db, user_id: str) -> dict:
+    db.expire_all()
+    row = db.get(MeasurementSummaryDB, user_id)
+    return {"total": row.total, "processing": row.status_processing, "done": row.status_done,
+            "error": row.status_error}
+
+
+def test_racing_reply_and_cancel_count_one_transition(db, service):
+    m = MeasurementDB(status=Status.processing, fs=200, format="npy", duration_sec=10.0, user_id="user-1")
+    db.add(m)
+    db.flush()
+    record_created(db, m)
+    db.commit()
+    db.get(MeasurementDB, m.id)  # both sessions saw it processing
+
+    other = SessionLocal()
+    service.loop.run_until_complete(MeasurementService(other, service.loop).cancel_analysis(m.id))
+    other.close()
+    service.apply_analysis_response(m.id, {"status": "ok", "features": {}})
+
+    assert counters(db, "user-1") == {"total": 1, "processing": 0, "done": 0, "error": 1}
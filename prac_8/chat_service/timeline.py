@@ -0,0 +1,116 @@
+"""
+Per-window probability timeline of a measurement (when AF/PVC occurred in a Holter recording).
+
+The worker sends a uint8 matrix (windows, labels) as base64 next to the averaged features; it is
+stored as-is in measurement_timelines.data. Queries work on an np.frombuffer view of the blob:
+only the requested slice or the found episodes become Python objects.
+"""
+import base64
+import json
+import math
+from typing import Optional
+
+import numpy as np
+
+from models import MeasurementTimelineDB
+
+QUANT_MAX = 254
+MISSING = 255
+SUPPORTED_ENCODINGS = ("u8",)
+
+
+def timeline_from_message(measurement_id: str, model_version: Optional[str], message: dict) -> MeasurementTimelineDB:
+    if message.get("encoding") not in SUPPORTED_ENCODINGS:
+        raise ValueError(f"Unsupported timeline encoding: {message.get('encoding')}")
+    data = base64.b64decode(message["data_b64"])
+    if len(data) != message["windows"] * len(message["labels"]):
+        raise ValueError("Timeline size does not match windows x labels")
+    return MeasurementTimelineDB(
+        measurement_id=measurement_id,
+        model_version=model_version,
+        labels=json.dumps(message["labels"]),
+        win_sec=float(message["win_sec"]),
+        windows=int(message["windows"]),
+        encoding=message["encoding"],
+        data=data,
+    )
+
+
+def timeline_matrix(row: MeasurementTimelineDB) -> np.ndarray:
+    """(windows, labels) uint8 view of the stored blob, no copy"""
+    labels = json.loads(row.labels)
+    return np.frombuffer(row.data, dtype=np.uint8).reshape(row.windows, len(labels))
+
+
+def _window_range(row: MeasurementTimelineDB, start: float, end: Optional[float]):
+    w0 = min(max(int(math.floor(start / row.win_sec)), 0), row.windows)
+    w1 = row.windows if end is None else min(max(int(math.ceil(end / row.win_sec)), 0), row.windows)
+    if w1 <= w0:
+        raise ValueError("Empty time range: end must be greater than start and within the recording")
+    return w0, w1
+
+
+def timeline_slice(row: MeasurementTimelineDB, start: float = 0.0, end: Optional[float] = None) -> dict:
+    labels = json.loads(row.labels)
+    w0, w1 = _window_range(row, start, end)
+    block = timeline_matrix(row)[w0:w1]
+    values = np.round(block / QUANT_MAX, 3)
+    missing = block == MISSING
+    probabilities = {}
+    for j, label in enumerate(labels):
+        column = values[:, j].tolist()
+        for i in np.flatnonzero(missing[:, j]):
+            column[i] = None
+        probabilities[label] = column
+    return {
+        "measurement_id": row.measurement_id,
+        "model_version": row.model_version,
+        "win_sec": row.win_sec,
+        "windows": row.windows,
+        "start": w0 * row.win_sec,
+        "end": w1 * row.win_sec,
+        "labels": labels,
+        "t": (np.arange(w0, w1) * row.win_sec).tolist(),
+        "probabilities": probabilities,
+    }
+
+
+def find_episodes(row: MeasurementTimelineDB, label: str, threshold: float = 0.5,
+                  min_sec: float = 0.0) -> dict:
+    """Runs of consecutive windows with p(label) >= threshold; unevaluated windows break a run"""
+    labels = json.loads(row.labels)
+    if label not in labels:
+        raise ValueError(f"Unknown label {label!r}, expected one of {labels}")
+    if not 0.0 <= threshold <= 1.0:
+        raise ValueError("threshold must be between 0 and 1")
+
+    column = timeline_matrix(row)[:, labels.index(label)]
+    above = (column != MISSING) & (column >= math.ceil(threshold * QUANT_MAX - 1e-9))
+    edges = np.diff(np.concatenate([[0], above.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    keep = (ends - starts) * row.win_sec >= min_sec
+    starts, ends = starts[keep], ends[keep]
+
+    episodes = []
+    if len(starts):
+        # sentinel so that reduceat over [start, end) works for a run ending at the last window
+        values = np.concatenate([column, [0]]).astype(np.float64) / QUANT_MAX
+        bounds = np.stack([starts, ends], axis=1).ravel()
+        peak = np.maximum.reduceat(values, bounds)[::2]
+        total = np.add.reduceat(values, bounds)[::2]
+        for s, e, p, t in zip(starts.tolist(), ends.tolist(), peak.tolist(), total.tolist()):
+            episodes.append({
+                "start_sec": s * row.win_sec,
+                "end_sec": e * row.win_sec,
+                "windows": e - s,
+                "max_prob": round(p, 3),
+                "mean_prob": round(t / (e - s), 3),
+            })
+    return {
+        "measurement_id": row.measurement_id,
+        "model_version": row.model_version,
+        "label": label,
+        "threshold": threshold,
+        "win_sec": row.win_sec,
+        "episodes": episodes,
+    }
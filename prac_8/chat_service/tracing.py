@@ -0,0 +1,36 @@
+from typing import Optional
+
+from opentelemetry import context, propagate, trace
+from opentelemetry.trace import SpanKind
+
+tracer = trace.get_tracer("chat_service")
+
+
+def amqp_headers() -> dict:
+    """W3C trace context (traceparent/tracestate) of the current span, for AMQP message headers"""
+    headers = {}
+    propagate.inject(headers)
+    return headers
+
+
+def context_from_headers(headers: Optional[dict]) -> context.Context:
+    return propagate.extract(headers or {})
+
+
+def publish_span(queue: str, headers: Optional[dict] = None):
+    """Producer span; headers: trace context to continue instead of the current one (outbox relay)"""
+    ctx = context_from_headers(headers) if headers is not None else None
+    return tracer.start_as_current_span(f"{queue} publish", context=ctx, kind=SpanKind.PRODUCER, attributes={
+        "messaging.system": "rabbitmq",
+        "messaging.destination.name": queue,
+    })
+
+
+def consume_span(queue: str, headers: Optional[dict]):
+    """Consumer span continuing the trace carried in the message headers"""
+    return tracer.start_as_current_span(
+        f"{queue} process",
+        context=context_from_headers(headers),
+        kind=SpanKind.CONSUMER,
+        attributes={"messaging.system": "rabbitmq", "messaging.source.name": queue},
+    )
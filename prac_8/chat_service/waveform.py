@@ -0,0 +1,262 @@
+"""
+Downsampled ECG previews for the UI (GET /v1/measurements/{id}/waveform).
+
+On first access the stored recording is turned into a min/max pyramid: level k keeps one
+(min, max) pair per WAVEFORM_BASE_BUCKET * 2**k samples, so peaks survive any zoom. Every level
+is a headerless float32 object in MinIO (waveform/<id>/L<k>.f32, interleaved min/max) next to
+meta.json, and is read tile by tile with range requests; tiles live in a process-wide LRU.
+A request picks the coarsest level that still gives `points` buckets over [start, end), so
+panning/zooming a 24 h recording touches a few 16 KiB tiles instead of the whole file.
+"""
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from minio.error import S3Error
+
+from metrics import WAVEFORM_TILE_REQUESTS
+
+WAVEFORM_PREFIX = os.getenv("WAVEFORM_PREFIX", "waveform")
+WAVEFORM_BASE_BUCKET = int(os.getenv("WAVEFORM_BASE_BUCKET", "8"))
+# pairs per tile; 2048 pairs = 16 KiB per range request
+WAVEFORM_TILE_BUCKETS = int(os.getenv("WAVEFORM_TILE_BUCKETS", "2048"))
+WAVEFORM_CACHE_TILES = int(os.getenv("WAVEFORM_CACHE_TILES", "4096"))
+WAVEFORM_DEFAULT_POINTS = 1000
+WAVEFORM_MAX_POINTS = int(os.getenv("WAVEFORM_MAX_POINTS", "5000"))
+# samples per step when building level 0 (keeps memory bounded for memmapped 24 h recordings)
+BUILD_CHUNK_SAMPLES = WAVEFORM_BASE_BUCKET * (1 << 16)
+VALUES_PER_TILE = 2 * WAVEFORM_TILE_BUCKETS
+# lead columns of multi-lead CSV uploads (same as ecg_analysis_service)
+LEAD_COLUMNS = ("I", "II", "III", "aVR", "aVL", "aVF", "V1", "V2", "V3", "V4", "V5", "V6")
+LEAD_COLUMN_RE = re.compile(r"^ECG_?\d+$")
+
+
+class TileCache:
+    """Thread-safe LRU of decoded tiles and pyramid metadata, shared by all requests"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items: "OrderedDict[tuple, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def drop(self, measurement_id: str):
+        with self._lock:
+            for key in [k for k in self._items if k[0] == measurement_id]:
+                del self._items[key]
+
+
+TILE_CACHE = TileCache(WAVEFORM_CACHE_TILES)
+# striped: one build per measurement at a time, fixed memory however many measurements are viewed
+_BUILD_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+def _build_lock(measurement_id: str) -> threading.Lock:
+    return _BUILD_LOCKS[hash(measurement_id) % len(_BUILD_LOCKS)]
+
+
+def load_signal(local_path: str, file_format: Optional[str], object_name: str) -> np.ndarray:
+    """
+    .npy is memory-mapped, CSV is parsed from the 'ECG' column (same layout the worker expects).
+    Multi-lead recordings ((leads, samples) .npy, CSV with I..V6 / ECG1.. columns) preview the first lead.
+    """
+    if file_format == "npy" or object_name.endswith(".npy"):
+        signal = np.load(local_path, mmap_mode="r", allow_pickle=False)
+        return signal[0] if signal.ndim == 2 else signal
+    with open(local_path, encoding="utf-8") as f:
+        header = [c.strip() for c in f.readline().split(",")]
+    if "ECG" in header:
+        column = header.index("ECG")
+    else:
+        leads = [i for i, c in enumerate(header) if c in LEAD_COLUMNS or LEAD_COLUMN_RE.match(c)]
+        if not leads:
+            raise ValueError("CSV has no 'ECG' or lead columns")
+        column = leads[0]
+    import pandas as pd  # only needed for CSV
+
+    # C parser: a 24 h CSV takes seconds instead of tens of seconds with np.loadtxt
+    df = pd.read_csv(local_path, usecols=[column], dtype=np.float32)
+    return df.iloc[:, 0].to_numpy()
+
+
+def minmax_pyramid(signal: np.ndarray, base: int = WAVEFORM_BASE_BUCKET,
+                   tile_buckets: int = WAVEFORM_TILE_BUCKETS) -> List[np.ndarray]:
+    """Levels of (n_buckets, 2) float32 min/max; the last level fits into a single tile"""
+    chunks = []
+    for start in range(0, len(signal), BUILD_CHUNK_SAMPLES):
+        chunk = np.asarray(signal[start:start + BUILD_CHUNK_SAMPLES], dtype=np.float32)
+        if len(chunk) % base:
+            # repeating the last sample does not change min/max of the tail bucket
+            chunk = np.pad(chunk, (0, base - len(chunk) % base), mode="edge")
+        blocks = chunk.reshape(-1, base)
+        chunks.append(np.stack([blocks.min(axis=1), blocks.max(axis=1)], axis=1))
+    level = np.concatenate(chunks)
+    levels = [level]
+    while len(level) > tile_buckets:
+        if len(level) % 2:
+            level = np.concatenate([level, level[-1:]])
+        pairs = level.reshape(-1, 2, 2)
+        level = np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1)
+        levels.append(level)
+    return levels
+
+
+def _raw_npy_offset(local_path: str) -> Optional[int]:
+    """Data offset of a 1-D little-endian float32 .npy, i.e. one that can be range-read as is"""
+    with open(local_path, "rb") as f:
+        if np.lib.format.read_magic(f) == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        if len(shape) == 1 and dtype == np.dtype("<f4"):
+            return f.tell()
+    return None
+
+
+class WaveformService:
+    def __init__(self, minio_service, cache: TileCache = TILE_CACHE):
+        self.minio_service = minio_service
+        self.cache = cache
+
+    @staticmethod
+    def _object(measurement_id: str, name: str) -> str:
+        return f"{WAVEFORM_PREFIX}/{measurement_id}/{name}"
+
+    def meta(self, measurement) -> dict:
+        meta = self.cache.get((measurement.id, "meta"))
+        if meta is not None:
+            return meta
+        with _build_lock(measurement.id):
+            meta = self.cache.get((measurement.id, "meta"))
+            if meta is None:
+                try:
+                    meta = json.loads(self.minio_service.read_file(self._object(measurement.id, "meta.json")))
+                except S3Error as e:
+                    if e.code != "NoSuchKey":
+                        raise
+                    meta = self.build(measurement)
+                self.cache.put((measurement.id, "meta"), meta)
+        return meta
+
+    def build(self, measurement) -> dict:
+        """Computes the pyramid from the stored recording and uploads it next to meta.json"""
+        object_name = measurement.ecg_file_url.rsplit("/", 1)[-1]
+        with tempfile.TemporaryDirectory() as tmp:
+            local_path = os.path.join(tmp, "signal")
+            self.minio_service.download_file(object_name, local_path)
+            signal = load_signal(local_path, measurement.format, object_name)
+            if signal.ndim != 1 or not len(signal):
+                raise ValueError("Waveform preview needs a non-empty single-lead recording")
+
+            offset = _raw_npy_offset(local_path) if isinstance(signal, np.memmap) else None
+            if offset is not None:
+                raw = {"object": object_name, "offset": offset}
+            else:
+                raw = {"object": self._object(measurement.id, "raw.f32"), "offset": 0}
+                self.minio_service.upload_file(raw["object"], np.ascontiguousarray(signal, dtype="<f4").tobytes())
+            series = [{**raw, "values": int(len(signal)), "bucket": 1}]
+
+            for k, level in enumerate(minmax_pyramid(signal)):
+                name = self._object(measurement.id, f"L{k}.f32")
+                self.minio_service.upload_file(name, np.ascontiguousarray(level, dtype="<f4").tobytes())
+                series.append({"object": name, "offset": 0, "values": int(level.size),
+                               "bucket": WAVEFORM_BASE_BUCKET << k})
+
+        meta = {"measurement_id": measurement.id, "fs": float(measurement.fs),
+                "samples": int(len(signal)), "series": series}
+        # meta.json last: its presence means the pyramid is complete
+        self.minio_service.upload_file(self._object(measurement.id, "meta.json"),
+                                       json.dumps(meta).encode("utf-8"), "application/json")
+        return meta
+
+    def _tile(self, meta: dict, level: int, index: int) -> np.ndarray:
+        key = (meta["measurement_id"], level, index)
+        tile = self.cache.get(key)
+        if tile is not None:
+            WAVEFORM_TILE_REQUESTS.labels(result="hit").inc()
+            return tile
+        WAVEFORM_TILE_REQUESTS.labels(result="miss").inc()
+        series = meta["series"][level]
+        first = index * VALUES_PER_TILE
+        count = min(VALUES_PER_TILE, series["values"] - first)
+        data = self.minio_service.read_file(series["object"], series["offset"] + 4 * first, 4 * count)
+        tile = np.frombuffer(data, dtype="<f4")
+        self.cache.put(key, tile)
+        return tile
+
+    def _read(self, meta: dict, level: int, a: int, b: int) -> np.ndarray:
+        """Values [a, b) of one series (raw samples or interleaved min/max)"""
+        first, last = a // VALUES_PER_TILE, (b - 1) // VALUES_PER_TILE
+        data = np.concatenate([self._tile(meta, level, i) for i in range(first, last + 1)])
+        offset = first * VALUES_PER_TILE
+        return data[a - offset:b - offset]
+
+    def waveform(self, measurement, start: float = 0.0, end: Optional[float] = None,
+                 points: int = WAVEFORM_DEFAULT_POINTS) -> dict:
+        if not 2 <= points <= WAVEFORM_MAX_POINTS:
+            raise ValueError(f"points must be between 2 and {WAVEFORM_MAX_POINTS}")
+        meta = self.meta(measurement)
+        fs, n = meta["fs"], meta["samples"]
+        i0 = min(max(int(math.floor(start * fs)), 0), n)
+        i1 = n if end is None else min(max(int(math.ceil(end * fs)), 0), n)
+        if i1 <= i0:
+            raise ValueError("Empty time range: end must be greater than start and within the recording")
+
+        span = i1 - i0
+        if span <= points:
+            y = self._read(meta, 0, i0, i1)
+            t, lo, hi, bucket, resolution = np.arange(i0, i1) / fs, y, y, 1, "raw"
+        else:
+            # coarsest level whose bucket still fits `points` times into the range
+            level = 0
+            while level + 1 < len(meta["series"]) and meta["series"][level + 1]["bucket"] * points <= span:
+                level += 1
+            size = meta["series"][level]["bucket"]
+            j0, j1 = i0 // size, -(-i1 // size)
+            if level == 0:
+                lo = hi = self._read(meta, 0, i0, i1)
+            else:
+                pairs = self._read(meta, level, 2 * j0, 2 * j1).reshape(-1, 2)
+                lo, hi = pairs[:, 0], pairs[:, 1]
+            # regroup level buckets into exactly `points` output buckets
+            edges = np.unique(np.linspace(0, len(lo), points, endpoint=False).astype(np.int64))
+            lo, hi = np.minimum.reduceat(lo, edges), np.maximum.reduceat(hi, edges)
+            first = i0 if level == 0 else j0 * size
+            t = (first + edges * size) / fs
+            bucket, resolution = span / len(edges), "minmax"
+
+        return {
+            "measurement_id": meta["measurement_id"],
+            "fs": fs,
+            "start": i0 / fs,
+            "end": i1 / fs,
+            "duration_sec": n / fs,
+            "resolution": resolution,
+            "bucket_sec": bucket / fs,
+            "t": np.round(t, 6).tolist(),
+            "min": lo.astype(float).tolist(),
+            "max": hi.astype(float).tolist(),
+        }
+
+    def remove(self, measurement_id: str):
+        self.cache.drop(measurement_id)
+        self.minio_service.remove_prefix(f"{WAVEFORM_PREFIX}/{measurement_id}/")
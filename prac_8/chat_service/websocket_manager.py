@@ -1,6 +1,8 @@
 from fastapi import WebSocket
 from typing import Dict, List
 import json
+import time
+from metrics import WS_ACTIVE_CONNECTIONS, WS_SEND_DROPS, WS_SEND_SECONDS
 from models import WebSocketMessage, Status, State
 
 class WebSocketManager:
@@ -14,10 +16,13 @@ class WebSocketManager:
             self.connections[user_id] = []
         
         self.connections[user_id].append(websocket)
+        WS_ACTIVE_CONNECTIONS.inc()
     
     def disconnect(self, websocket: WebSocket, user_id: str):
-        if user_id in self.connections:
+        # the socket may already be dropped by send_to_user after a failed send
+        if user_id in self.connections and websocket in self.connections[user_id]:
             self.connections[user_id].remove(websocket)
+            WS_ACTIVE_CONNECTIONS.dec()
             if not self.connections[user_id]:
                 del self.connections[user_id]
     
@@ -27,14 +32,18 @@ class WebSocketManager:
             disconnected = []
             
             for websocket in self.connections[user_id]:
+                started = time.perf_counter()
                 try:
                     await websocket.send_text(message_json)
+                    WS_SEND_SECONDS.observe(time.perf_counter() - started)
                 except:
+                    WS_SEND_DROPS.inc()
                     disconnected.append(websocket)
             
             # Remove disconnected websockets
             for ws in disconnected:
                 self.connections[user_id].remove(ws)
+                WS_ACTIVE_CONNECTIONS.dec()
             
             # Clean up empty user connections
             if not self.connections[user_id]:
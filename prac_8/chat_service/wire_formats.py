@@ -0,0 +1,165 @@
+import json
+import os
+import zlib
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Mapping, Optional
+
+import msgpack
+import numpy as np
+
+# Content types accepted by POST /v1/measurements/json
+JSON_TYPES = ("application/json",)
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+RAW_FLOAT32_TYPES = ("application/x-ecg-float32", "application/octet-stream")
+RAW_INT16_TYPES = ("application/x-ecg-int16",)
+
+# Upper bound for a decoded (decompressed) body, protects against gzip bombs
+MAX_BODY_BYTES = int(os.getenv("MAX_MEASUREMENT_BODY_BYTES", str(200 * 1024 * 1024)))
+
+
+class WireFormatError(ValueError):
+    """Body could not be decoded into an ECG signal"""
+
+
+class UnsupportedMediaType(WireFormatError):
+    """Content type is not one of the accepted wire formats"""
+
+
+@dataclass
+class DecodedMeasurement:
+    ecg: np.ndarray
+    fs: Any
+    state: Any
+
+
+def _media_type(content_type: Optional[str]) -> str:
+    if not content_type:
+        return "application/json"
+    return content_type.split(";", 1)[0].strip().lower()
+
+
+def _decompress(body: bytes, content_encoding: Optional[str]) -> bytes:
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding in ("identity", ""):
+        return body
+    if encoding not in ("gzip", "x-gzip"):
+        raise UnsupportedMediaType(f"Unsupported Content-Encoding: {content_encoding}")
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, MAX_BODY_BYTES)
+    except zlib.error as e:
+        raise WireFormatError(f"Invalid gzip body: {e}") from e
+    if decompressor.unconsumed_tail:
+        raise WireFormatError("Decompressed body is too large")
+    return data
+
+
+def _from_param(name: str, headers: Mapping[str, str], query: Mapping[str, str]) -> Optional[str]:
+    """Raw formats carry fs/state in query string or X-ECG-* headers"""
+    value = query.get(name)
+    if value is None:
+        value = headers.get(f"x-ecg-{name}")
+    return value
+
+
+def _int_or_raw(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _decode_json(data: bytes) -> dict:
+    try:
+        payload = json.loads(data)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise WireFormatError(f"Invalid JSON body: {e}") from e
+    if not isinstance(payload, dict):
+        raise WireFormatError("JSON body must be an object")
+    return payload
+
+
+def _decode_msgpack(data: bytes) -> dict:
+    try:
+        payload = msgpack.unpackb(data, raw=False)
+    except Exception as e:
+        raise WireFormatError(f"Invalid MessagePack body: {e}") from e
+    if not isinstance(payload, dict):
+        raise WireFormatError("MessagePack body must be a map")
+    return payload
+
+
+def _ecg_to_array(ecg: Any) -> np.ndarray:
+    """list of numbers -> float32; bin (MessagePack) -> little-endian float32 without copying"""
+    if isinstance(ecg, (bytes, bytearray, memoryview)):
+        return _raw_to_array(ecg, "<f4")
+    if not isinstance(ecg, list):
+        raise WireFormatError("ecg must be an array")
+    try:
+        return np.asarray(ecg, dtype=np.float32)
+    except (TypeError, ValueError) as e:
+        raise WireFormatError("ecg must contain only numbers") from e
+
+
+def _raw_to_array(data, dtype: str) -> np.ndarray:
+    itemsize = np.dtype(dtype).itemsize
+    if len(data) % itemsize:
+        raise WireFormatError(f"Body length must be a multiple of {itemsize} bytes")
+    return np.frombuffer(data, dtype=dtype)
+
+
+def decode_measurement_body(
+        body: bytes,
+        headers: Mapping[str, str],
+        query: Mapping[str, str],
+) -> DecodedMeasurement:
+    """
+    Decode request body into a numpy buffer.
+
+    - application/json (optionally Content-Encoding: gzip): {"ecg": [...], "fs": 250, "state": "rest"}
+    - application/msgpack: same map, "ecg" may be an array or bin with little-endian float32
+    - application/x-ecg-float32 / application/octet-stream: raw little-endian float32 samples
+    - application/x-ecg-int16: raw little-endian int16 samples, optional X-ECG-Scale multiplier
+    For raw formats fs and state are taken from query (?fs=&state=) or X-ECG-Fs / X-ECG-State headers.
+    """
+    media_type = _media_type(headers.get("content-type"))
+    data = _decompress(body, headers.get("content-encoding"))
+
+    if media_type in JSON_TYPES or media_type in MSGPACK_TYPES:
+        payload = _decode_json(data) if media_type in JSON_TYPES else _decode_msgpack(data)
+        if "ecg" not in payload:
+            raise WireFormatError("ecg, fs, and state are required")
+        ecg = _ecg_to_array(payload["ecg"])
+        fs = payload.get("fs", _int_or_raw(_from_param("fs", headers, query)))
+        state = payload.get("state", _from_param("state", headers, query))
+    elif media_type in RAW_FLOAT32_TYPES:
+        ecg = _raw_to_array(data, "<f4")
+        fs = _int_or_raw(_from_param("fs", headers, query))
+        state = _from_param("state", headers, query)
+    elif media_type in RAW_INT16_TYPES:
+        ecg = _raw_to_array(data, "<i2")
+        scale = _from_param("scale", headers, query)
+        try:
+            ecg = ecg.astype(np.float32) * np.float32(scale if scale is not None else 1.0)
+        except ValueError as e:
+            raise WireFormatError("scale must be a number") from e
+        fs = _int_or_raw(_from_param("fs", headers, query))
+        state = _from_param("state", headers, query)
+    else:
+        raise UnsupportedMediaType(f"Unsupported Content-Type: {media_type}")
+
+    if fs is None or state is None:
+        raise WireFormatError("ecg, fs, and state are required")
+
+    return DecodedMeasurement(ecg=ecg.astype(np.float32, copy=False), fs=fs, state=state)
+
+
+def to_npy_bytes(ecg: np.ndarray) -> bytes:
+    """Serialize signal as .npy — the worker loads it with np.load without CSV parsing"""
+    buf = BytesIO()
+    np.save(buf, np.ascontiguousarray(ecg, dtype=np.float32), allow_pickle=False)
+    return buf.getvalue()
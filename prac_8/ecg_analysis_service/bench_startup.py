@@ -0,0 +1,81 @@
+"""
+Замер холодного старта воркера: каждый сценарий — отдельный процесс Python.
+
+    python bench_startup.py [--runs 3]
+
+Фазы: импорт service (torch, torch_ecg, клиенты), загрузка модели, прогрев,
+первый результат infer_ecg_1d на 10-секундной записи.
+Сценарии: пустой реестр моделей, реестр с весами без прогрева, с весами + прогрев (как в main()).
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from service import REGISTRY
+from model import infer_ecg_1d, warmup
+import numpy as np
+t1 = time.perf_counter()
+REGISTRY.warm = False
+REGISTRY.bootstrap()
+REGISTRY.refresh_default()
+entry = REGISTRY.get()
+t2 = time.perf_counter()
+if WARMUP:
+    warmup(entry.model, fs=entry.meta.fs, win_sec=entry.meta.win_sec)
+t3 = time.perf_counter()
+fs = 500
+t = np.arange(10 * fs) / fs
+x = (np.exp(-((t % 0.8) - 0.3) ** 2 / 2e-4) + 0.1 * np.sin(2 * np.pi * 1.25 * t)).astype(np.float32)
+infer_ecg_1d(model=entry.model, x_1d=x, fs_src=fs, labels=entry.meta.labels)
+t4 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "model_load": t2 - t1, "warmup": t3 - t2,
+                  "first_result": t4 - t3, "total": t4 - t0}))
+"""
+
+SCENARIOS = [
+    ("empty registry", False, False),
+    ("cached weights", True, False),
+    ("cached weights + warmup", True, True),
+]
+PHASES = ("import", "model_load", "warmup", "first_result", "total")
+
+
+def run_child(registry_dir: str, warmup: bool) -> dict:
+    env = dict(os.environ, MODEL_REGISTRY_DIR=registry_dir, MODEL_REGISTRY_BUCKET="", OPENAI_API_KEY="")
+    out = subprocess.run(
+        [sys.executable, "-c", f"WARMUP = {warmup}\n" + CHILD],
+        cwd=HERE, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        registry_dir = os.path.join(cache_dir, "registry")
+        print(f"{'scenario':<26}" + "".join(f"{p:>14}" for p in PHASES))
+        for name, cached, warmup in SCENARIOS:
+            results = []
+            for _ in range(args.runs):
+                if not cached:
+                    shutil.rmtree(registry_dir, ignore_errors=True)
+                results.append(run_child(registry_dir, warmup))
+            # медиана по запускам, секунды
+            row = [sorted(r[p] for r in results)[len(results) // 2] for p in PHASES]
+            print(f"{name:<26}" + "".join(f"{v:>14.3f}" for v in row))
+
+
+if __name__ == "__main__":
+    main()
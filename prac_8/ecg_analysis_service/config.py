@@ -1,6 +1,9 @@
+import json
 import os
-import time
-from typing import Dict, Any
+import random
+import tempfile
+import threading
+from typing import Dict, Any, Callable, List, Optional, Tuple
 
 import requests
 
@@ -13,8 +16,14 @@ DEFAULT_BRANCH = "main"  # Ветка, из которой брать конфи
 DEFAULT_APP_NAME = "python-service"  # Имя приложения (например, chat-service)
 DEFAULT_PROFILE = "dev"  # Профиль (например, dev, prod)
 
-MAX_RETRIES = 5
-RETRY_DELAY_SECONDS = 5
+# Снимок последней успешно загруженной конфигурации: используется сразу при старте,
+# сеть в пути запуска не нужна
+CONFIG_CACHE_DIR = os.getenv("CONFIG_CACHE_DIR", os.path.join(tempfile.gettempdir(), "config-cache"))
+FETCH_TIMEOUT_SECONDS = float(os.getenv("CONFIG_FETCH_TIMEOUT_SEC", "5"))
+# Фоновое обновление: период опроса и экспоненциальный backoff с jitter при ошибках
+REFRESH_INTERVAL_SECONDS = float(os.getenv("CONFIG_REFRESH_SEC", "60"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 300.0
 
 
 class ConfigClient:
@@ -22,9 +31,13 @@ class ConfigClient:
     Класс для загрузки конфигурации напрямую из GitHub.
     Ожидает конфигурационный файл в формате:
     https://raw.githubusercontent.com/{owner}/{repo}/{branch}/{app_name}-{profile}.yml
+
+    Конструктор не ходит в сеть: конфигурация берётся из снимка на диске, а свежая версия
+    подтягивается фоновым потоком условными запросами (If-None-Match). Подписчики
+    (subscribe) получают новые значения ключей без перезапуска сервиса.
     """
 
-    def __init__(self):
+    def __init__(self, background_refresh: bool = True):
         # Настройки GitHub
         self.repo_owner = os.getenv("GITHUB_REPO_OWNER", DEFAULT_REPO_OWNER)
         self.repo_name = os.getenv("GITHUB_REPO_NAME", DEFAULT_REPO_NAME)
@@ -35,9 +48,21 @@ class ConfigClient:
         self.app_name = os.getenv("APPLICATION_NAME", DEFAULT_APP_NAME)
         self.profile = os.getenv("PROFILE_NAME", DEFAULT_PROFILE)
         self.config: Dict[str, Any] = {}
+        self.etag: Optional[str] = None
 
-        # Первоначальная загрузка
-        self.load_config()
+        self._subscribers: Dict[str, List[Callable[[Any], None]]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Первоначальная загрузка — только с диска
+        self._load_snapshot()
+        if background_refresh:
+            self.start()
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(CONFIG_CACHE_DIR, f"{self.app_name}-{self.profile}.json")
 
     def _simple_yaml_parser(self, yaml_content: str) -> Dict[str, Any]:
         """
@@ -66,9 +91,35 @@ class ConfigClient:
                 config[key] = value
         return config
 
-    def _fetch_config(self) -> str:
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            print("Снимок конфигурации не найден, до первой загрузки используется пустая конфигурация.")
+            return
+        except (OSError, ValueError) as e:
+            print(f"Предупреждение: снимок конфигурации повреждён ({e}), игнорируется.")
+            return
+        self.config = snapshot.get("config", {})
+        self.etag = snapshot.get("etag")
+        print(f"Конфигурация загружена из снимка {self.snapshot_path}")
+
+    def _save_snapshot(self):
+        # запись через временный файл + rename: параллельный старт не прочитает половину файла
+        try:
+            os.makedirs(CONFIG_CACHE_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=CONFIG_CACHE_DIR, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"etag": self.etag, "config": self.config}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"Предупреждение: не удалось сохранить снимок конфигурации: {e}")
+
+    def _fetch_config(self) -> Tuple[Optional[str], Optional[str]]:
         """
-        Отправляет HTTP-запрос к GitHub Raw API и возвращает сырой текст YAML.
+        Один условный запрос к GitHub Raw API.
+        Возвращает (yaml, etag); (None, None) — не изменилась (304). Ошибки сети пробрасываются.
         """
         filename = f"{self.app_name}-{self.profile}.yml"
 
@@ -82,46 +133,51 @@ class ConfigClient:
         if self.github_token:
             # Аутентификация с помощью Personal Access Token (PAT)
             headers['Authorization'] = f'token {self.github_token}'
-
-        for attempt in range(MAX_RETRIES):
-            try:
-                print(f"Попытка {attempt + 1}: Загрузка конфигурации из {config_url}")
-                response = requests.get(config_url, headers=headers, timeout=10)
-                response.raise_for_status()  # Вызывает исключение для 4xx/5xx
-
-                return response.text  # Возвращаем сырой текст YAML
-
-            except requests.exceptions.HTTPError as e:
-                # 404 Not Found - это нормально, если конфигурации для профиля нет
-                if response.status_code == 404:
-                    print(f"Предупреждение: Конфигурационный файл {filename} не найден (404).")
-                    return ""
-                raise
-            except requests.exceptions.RequestException as e:
-                print(f"Ошибка подключения к GitHub/загрузки: {e}")
-                if attempt < MAX_RETRIES - 1:
-                    print(f"Повторная попытка через {RETRY_DELAY_SECONDS} сек...")
-                    time.sleep(RETRY_DELAY_SECONDS)
-                else:
-                    print("Не удалось загрузить конфигурацию после всех попыток.")
-                    raise ConnectionError("Не удалось получить конфигурацию из GitHub.") from e
-
-        return ""
-
-    def load_config(self):
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+
+        response = requests.get(config_url, headers=headers, timeout=FETCH_TIMEOUT_SECONDS)
+        if response.status_code == 304:
+            return None, None
+        # 404 Not Found - это нормально, если конфигурации для профиля нет
+        if response.status_code == 404:
+            print(f"Предупреждение: Конфигурационный файл {filename} не найден (404).")
+            return "", None
+        response.raise_for_status()  # Вызывает исключение для 4xx/5xx
+        return response.text, response.headers.get("ETag")
+
+    def load_config(self) -> bool:
         """
-        Загружает, парсит и сохраняет конфигурацию.
+        Загружает, парсит и сохраняет конфигурацию. Возвращает True, если она изменилась.
         """
-        yaml_content = self._fetch_config()
-
-        if not yaml_content:
-            print("Предупреждение: Использование пустой конфигурации.")
-            self.config = {}
-            return
+        yaml_content, etag = self._fetch_config()
+        if yaml_content is None:
+            return False
+
+        new_config = self._simple_yaml_parser(yaml_content) if yaml_content else {}
+        with self._lock:
+            old_config, self.config, self.etag = self.config, new_config, etag
+        self._save_snapshot()
+        if new_config == old_config:
+            return False
+
+        print("Конфигурация обновлена.")
+        self._notify(old_config, new_config)
+        return True
+
+    def _notify(self, old_config: Dict[str, Any], new_config: Dict[str, Any]):
+        for key, callbacks in list(self._subscribers.items()):
+            if old_config.get(key) == new_config.get(key):
+                continue
+            for callback in callbacks:
+                try:
+                    callback(new_config.get(key))
+                except Exception as e:
+                    print(f"Ошибка подписчика конфигурации {key}: {e}")
 
-        # Используем наш простой парсер
-        self.config = self._simple_yaml_parser(yaml_content)
-        print("Конфигурация успешно загружена и доступна.")
+    def subscribe(self, key: str, callback: Callable[[Any], None]):
+        """callback(value) вызывается из фонового потока при каждом изменении значения key"""
+        self._subscribers.setdefault(key, []).append(callback)
 
     def get(self, key: str, default: Any = None) -> Any:
         """
@@ -135,5 +191,25 @@ class ConfigClient:
         """
         print("--- Выполняется обновление конфигурации ---")
         self.load_config()
-        # В реальном приложении здесь должна быть реализована логика обновления
-        # внутренних компонентов (например, пересоздание пула соединений с БД).
\ No newline at end of file
+
+    def _refresh_loop(self):
+        failures = 0
+        delay = 0.0  # первая загрузка — сразу после старта
+        while not self._stop.wait(delay):
+            try:
+                self.load_config()
+                failures = 0
+                # jitter, чтобы реплики не ходили в GitHub синхронно
+                delay = REFRESH_INTERVAL_SECONDS * random.uniform(0.8, 1.2)
+            except Exception as e:
+                failures += 1
+                delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** failures))
+                print(f"Ошибка загрузки конфигурации ({e}), повтор через {delay:.1f} сек")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name="config-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
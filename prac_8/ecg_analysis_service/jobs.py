@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def deadline_exceeded(msg: dict, now: Optional[float] = None) -> bool:
+    """
+    Проверяет поле 'deadline' (unix time, сек) из сообщения.
+    Сообщения без дедлайна (старые продюсеры) считаются актуальными.
+    """
+    deadline = msg.get("deadline")
+    if deadline is None:
+        return False
+    return (time.time() if now is None else now) > float(deadline)
+
+
+class CancelRegistry:
+    """
+    Отозванные задачи: measurement_id -> момент, после которого запись можно забыть.
+    Ограничен по размеру и времени жизни записей, чтобы не расти бесконечно.
+    """
+
+    def __init__(self, ttl_sec: float = 24 * 3600, max_size: int = 100_000):
+        self.ttl_sec = ttl_sec
+        self.max_size = max_size
+        self._items: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cancel(self, measurement_id: str, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._items.pop(measurement_id, None)
+            self._items[measurement_id] = now + self.ttl_sec
+            self._prune(now)
+
+    def is_cancelled(self, measurement_id: str, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            expires_at = self._items.get(measurement_id)
+            if expires_at is None:
+                return False
+            if expires_at < now:
+                del self._items[measurement_id]
+                return False
+            return True
+
+    def _prune(self, now: float):
+        # записи упорядочены по времени добавления => и по времени истечения
+        while self._items:
+            measurement_id, expires_at = next(iter(self._items.items()))
+            if expires_at >= now and len(self._items) <= self.max_size:
+                break
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
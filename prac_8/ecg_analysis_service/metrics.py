@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from tracing import tracer
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8080"))
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+QUEUE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 900)
+
+INFLIGHT_JOBS = Gauge("ecg_worker_inflight_jobs", "Jobs being processed right now", ["lane"])
+CONSUMERS = Gauge("ecg_worker_consumers", "Consumer threads (max concurrent jobs)", ["lane"])
+# inflight / consumers: 1.0 — все консьюмеры заняты, метрика для HPA
+UTILIZATION = Gauge("ecg_worker_utilization", "Share of consumer threads busy with a job")
+MESSAGES = Counter("ecg_worker_messages_total", "Processed messages (rate() gives msgs/s)", ["lane", "status"])
+JOB_SECONDS = Histogram("ecg_worker_job_duration_seconds", "Whole job processing time",
+                        ["lane"], buckets=STAGE_BUCKETS)
+STAGE_SECONDS = Histogram("ecg_worker_stage_duration_seconds", "Duration of a processing stage",
+                          ["stage"], buckets=STAGE_BUCKETS)
+QUEUE_SECONDS = Histogram("ecg_worker_queue_time_seconds", "Time from publish (published_at) to pickup",
+                          ["lane"], buckets=QUEUE_BUCKETS)
+MODEL_READY = Gauge("ecg_worker_model_ready", "1 when the model is loaded and warmed up")
+LOADED_MODELS = Gauge("ecg_worker_loaded_models", "Model versions held in the in-memory LRU")
+MODEL_LOADS = Counter("ecg_worker_model_loads_total", "Model loads from the registry (LRU misses)", ["version"])
+# 1 у текущей версии по умолчанию: видно, какие поды уже переключились
+DEFAULT_MODEL_VERSION = Gauge("ecg_worker_default_model", "Current default model version", ["version"])
+
+_lock = threading.Lock()
+_inflight = 0
+_capacity = 0
+
+
+@contextmanager
+def stage(name: str):
+    """Этап обработки: спан трейса + гистограмма длительности (в том числе у этапов, завершившихся ошибкой)"""
+    started = time.perf_counter()
+    try:
+        with tracer.start_as_current_span(name) as span:
+            yield span
+    finally:
+        STAGE_SECONDS.labels(stage=name).observe(time.perf_counter() - started)
+
+
+def set_capacity(lanes: dict):
+    global _capacity
+    for lane, workers in lanes.items():
+        CONSUMERS.labels(lane=lane).set(workers)
+    _capacity = sum(lanes.values())
+
+
+@contextmanager
+def track_job(lane: str):
+    global _inflight
+    INFLIGHT_JOBS.labels(lane=lane).inc()
+    with _lock:
+        _inflight += 1
+        UTILIZATION.set(_inflight / max(1, _capacity))
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        JOB_SECONDS.labels(lane=lane).observe(time.perf_counter() - started)
+        INFLIGHT_JOBS.labels(lane=lane).dec()
+        with _lock:
+            _inflight -= 1
+            UTILIZATION.set(_inflight / max(1, _capacity))
+
+
+def observe_queue_time(lane: str, published_at: Optional[float]):
+    if published_at:
+        QUEUE_SECONDS.labels(lane=lane).observe(max(0.0, time.time() - float(published_at)))
+
+
+class HealthState:
+    """
+    liveness  (/healthz): все консьюмеры живы (поток упал — под перезапускается); до их старта — ok;
+    readiness (/readyz):  модель загружена и консьюмеры живы.
+    """
+
+    def __init__(self):
+        self.model_ready = False
+        self.consumers_alive: Callable[[], bool] = lambda: True
+
+    def set_model_ready(self, ready: bool):
+        self.model_ready = ready
+        MODEL_READY.set(1 if ready else 0)
+
+    def live(self) -> bool:
+        return self.consumers_alive()
+
+    def ready(self) -> bool:
+        return self.model_ready and self.consumers_alive()
+
+
+HEALTH = HealthState()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(200, generate_latest(), CONTENT_TYPE_LATEST)
+        elif self.path == "/healthz":
+            ok = HEALTH.live()
+            self._send(200 if ok else 503, b"ok" if ok else b"consumer down")
+        elif self.path == "/readyz":
+            ok = HEALTH.ready()
+            self._send(200 if ok else 503, b"ok" if ok else b"not ready")
+        else:
+            self._send(404, b"not found")
+
+    def _send(self, code: int, body: bytes, content_type: str = "text/plain"):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # пробы k8s раз в несколько секунд — не засоряем лог
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
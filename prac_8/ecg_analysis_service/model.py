@@ -1,28 +1,48 @@
+import os
+import tempfile
+from math import gcd
+from typing import Iterable, Iterator, Sequence
+
 import numpy as np
 import torch
-from scipy.signal import resample
+from scipy.signal import resample, resample_poly
 from torch_ecg.models import ECG_CRNN  # модель для последовательной классификации
 
+from metrics import stage
+from quality import QUALITY_GATE_ENABLED, QualityStats
+from timeline import ProbabilityTimeline
+
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
 LABELS = ["Normal", "AF", "PVC"]
 
+# Локальный кэш весов (реестр моделей, скачанные из MinIO версии): переживает рестарт контейнера
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ecg-model-cache"))
+# размеры батча для прогрева: одиночное окно (RPC) и типичная запись; 64 окна потокового режима
+# на CPU прогревались бы ~2 с и задерживали readiness
+WARMUP_BATCH_SIZES = tuple(int(b) for b in os.getenv("WARMUP_BATCH_SIZES", "1,8").split(","))
+
 def standardize_fs(x: np.ndarray, fs_src: int, fs_tgt: int = 250):
+    # x: (samples,) или (leads, samples) — все отведения ресэмплятся одним вызовом по последней оси
     if fs_src == fs_tgt:
         return x.astype(np.float32), fs_src
-    L_tgt = int(round(len(x) * fs_tgt / fs_src))
-    x = resample(x, L_tgt).astype(np.float32)
+    L_tgt = int(round(x.shape[-1] * fs_tgt / fs_src))
+    x = resample(x, L_tgt, axis=-1).astype(np.float32)
     return x, fs_tgt
 
+def pad_last(x: np.ndarray, n: int) -> np.ndarray:
+    # дополнение нулями по оси отсчётов до n
+    return np.pad(x, [(0, 0)] * (x.ndim - 1) + [(0, n - x.shape[-1])])
+
 def to_windows_1d(x: np.ndarray, fs: int, win_sec: float = 10.0, step_sec: float | None = None):
     if step_sec is None:
         step_sec = win_sec
     w = int(win_sec * fs)
     s = int(step_sec * fs)
-    if len(x) < w:
-        x = np.pad(x, (0, w - len(x)))
-    idxs = range(0, len(x) - w + 1, s)
-    wins = np.stack([x[i:i + w] for i in idxs], axis=0)  # (N, w)
+    if x.shape[-1] < w:
+        x = pad_last(x, w)
+    idxs = range(0, x.shape[-1] - w + 1, s)
+    wins = np.stack([x[..., i:i + w] for i in idxs], axis=0)  # (N, w) или (N, leads, w)
     return wins
 
 def normalize(z: np.ndarray):
@@ -30,30 +50,331 @@ def normalize(z: np.ndarray):
     return (z - mu) / (sd + 1e-6)
 
 def build_model(in_channels=1, classes=LABELS):
-    # под 1D-канал
+    # in_channels — число отведений, вход (B, in_channels, L)
     model = ECG_CRNN(n_leads=in_channels, classes=classes)
     model.to(DEVICE).eval()
     return model
 
-@torch.no_grad()
-def infer_ecg_1d(model: torch.nn.Module, x_1d: np.ndarray, fs_src: int,
-                 fs_tgt: int = 250, win_sec: float = 10.0):
-    # ресэмплинг/окна/нормализация
-    x_1d, fs = standardize_fs(x_1d, fs_src, fs_tgt)
-    wins = to_windows_1d(x_1d, fs=fs, win_sec=win_sec, step_sec=win_sec)
-    wins = np.stack([normalize(w) for w in wins], axis=0)  # (N, L)
+def save_state_dict(model: torch.nn.Module, path: str):
+    # через временный файл: параллельно стартующий под не прочитает недописанные веса
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    os.close(fd)
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+
+def load_model(weights_path: str, in_channels=1, classes=LABELS):
+    """Модель с сериализованными весами (state dict) — без случайной инициализации между рестартами."""
+    model = build_model(in_channels=in_channels, classes=classes)
+    model.load_state_dict(torch.load(weights_path, map_location=DEVICE, weights_only=True))
+    return model
 
-    # в тензор B,C,L
-    t = torch.from_numpy(wins).float().unsqueeze(1).to(DEVICE)  # (B,1,L)
+def normalize_windows(wins: np.ndarray) -> np.ndarray:
+    # то же, что normalize(), но сразу для всех окон (N, L) и каждого отведения окон (N, leads, L)
+    mu = wins.mean(axis=-1, keepdims=True)
+    sd = wins.std(axis=-1, keepdims=True)
+    return ((wins - mu) / (sd + 1e-6)).astype(np.float32, copy=False)
+
+@torch.no_grad()
+def predict_proba(model: torch.nn.Module, wins: np.ndarray) -> np.ndarray:
+    # в тензор B,C,L: одно отведение (B, L) -> (B,1,L), несколько уже (B, leads, L)
+    t = torch.from_numpy(np.ascontiguousarray(wins)).float()
+    if t.ndim == 2:
+        t = t.unsqueeze(1)
+    t = t.to(DEVICE)
 
     # логиты -> вероятности
     logits = model(t)                    # форма зависит от модели, у seq-lab обычно (B, num_classes) для класа
     if logits.ndim > 2:                  # на всякий случай усредним по времени, если seq-label помечает покадрово
         logits = logits.mean(dim=-1)
-    probs = torch.sigmoid(logits).cpu().numpy()  # (B, num_classes) для multi-label
+    return torch.sigmoid(logits).cpu().numpy()  # (B, num_classes) для multi-label
+
+@torch.no_grad()
+def infer_ecg_1d(model: torch.nn.Module, x_1d: np.ndarray, fs_src: int,
+                 fs_tgt: int = 250, win_sec: float = 10.0, quality_gate: bool = QUALITY_GATE_ENABLED,
+                 labels: Sequence[str] = LABELS, timeline: ProbabilityTimeline | None = None):
+    # ресэмплинг/окна/нормализация
+    with stage("resample"):
+        x_1d, fs = standardize_fs(x_1d, fs_src, fs_tgt)
+    with stage("window") as span:
+        wins = to_windows_1d(x_1d, fs=fs, win_sec=win_sec, step_sec=win_sec)
+        span.set_attribute("ecg.windows", len(wins))
+
+    quality = {}
+    total = len(wins)
+    positions = np.arange(total)
+    if quality_gate:
+        # качество оценивается по сырым окнам: после нормализации обрыв и насыщение не видны
+        with stage("quality") as span:
+            stats = QualityStats()
+            good = stats.evaluate(wins, fs)
+            wins, positions = wins[good], positions[good]
+            span.set_attribute("ecg.windows_used", len(wins))
+            quality = stats.check()  # PoorSignalQuality — модель не вызывается
+
+    wins = normalize_windows(wins)  # (N, L) или (N, leads, L) — один проход модели на все окна
+    with stage("infer"):
+        probs = predict_proba(model, wins)
+    if timeline is not None:
+        timeline.windows = total
+        timeline.update(probs, positions)
 
     # агрегируем по окнам средним
     mean_probs = probs.mean(axis=0)
-    return {LABELS[i]: float(mean_probs[i]) for i in range(len(LABELS))}
+    out = {labels[i]: float(mean_probs[i]) for i in range(len(labels))}
+    out.update(quality)
+    return out
+
+# ===================== Потоковый режим для длинных записей =====================
+# Память не зависит от длительности: сигнал читается чанками, ресэмплится блоками
+# с перекрытием на границах, окна идут в модель мини-батчами, вероятности агрегируются онлайн.
+
+RESAMPLE_PAD_SEC = 1.0  # контекст с каждой стороны блока, гасит краевые эффекты фильтра
+
+def stream_windows(chunks: Iterable[np.ndarray], fs_src: int, fs_tgt: int = 250,
+                   win_sec: float = 10.0, windows_per_block: int = 64) -> Iterator[np.ndarray]:
+    """
+    Превращает поток чанков сигнала (в частоте fs_src) в поток блоков окон (K, L) в частоте fs_tgt.
+    Чанки (leads, n) многоканальной записи дают блоки (K, leads, L).
+    Окна идут встык (step = win_sec), как в infer_ecg_1d; неполный хвост отбрасывается.
+    """
+    g = gcd(int(fs_src), int(fs_tgt))
+    up, down = int(fs_tgt) // g, int(fs_src) // g
+    w_src = int(round(win_sec * fs_src))
+    w_tgt = int(round(win_sec * fs_tgt))
+    block_src = w_src * windows_per_block
+    # контекст кратен down, чтобы границы блоков точно ложились на отсчёты целевой частоты
+    pad_src = 0 if up == down else down * int(np.ceil(RESAMPLE_PAD_SEC * fs_src / down))
+
+    def _resample(seg: np.ndarray, left: int) -> np.ndarray:
+        if up == down:
+            return seg[..., left:]
+        y = resample_poly(seg, up, down, axis=-1).astype(np.float32, copy=False)
+        return y[..., left * up // down:]
+
+    def _split(y: np.ndarray, n: int) -> np.ndarray:
+        # (..., n * L) -> (n, L) или (n, leads, L)
+        y = y[..., :n * w_tgt]
+        if y.ndim == 1:
+            return y.reshape(n, w_tgt)
+        return y.reshape(y.shape[0], n, w_tgt).transpose(1, 0, 2)
 
-DEFAULT_MODEL = build_model(in_channels=1, classes=LABELS)
\ No newline at end of file
+    buf = left_ctx = None
+    emitted = 0
+    for chunk in chunks:
+        chunk = np.asarray(chunk, dtype=np.float32)
+        chunk = chunk.ravel() if chunk.ndim < 2 else chunk
+        if buf is None:
+            buf = left_ctx = chunk[..., :0]
+        buf = np.concatenate([buf, chunk], axis=-1)
+        while buf.shape[-1] >= block_src + pad_src:
+            seg = np.concatenate([left_ctx, buf[..., :block_src + pad_src]], axis=-1)
+            yield _split(_resample(seg, left_ctx.shape[-1]), windows_per_block)
+            emitted += windows_per_block
+            left_ctx = buf[..., block_src - pad_src:block_src]
+            buf = buf[..., block_src:]
+
+    if buf is None:
+        buf = left_ctx = np.empty(0, dtype=np.float32)
+    # хвост: всё, что осталось, плюс левый контекст
+    y = _resample(np.concatenate([left_ctx, buf], axis=-1), left_ctx.shape[-1])
+    n = y.shape[-1] // w_tgt
+    if n == 0 and emitted == 0:
+        # запись короче одного окна — дополняем нулями, как to_windows_1d
+        y, n = pad_last(y, w_tgt), 1
+    if n:
+        yield _split(y, n)
+
+class OnlineAggregator:
+    """Онлайн-агрегация вероятностей по окнам: среднее, максимум и время максимума по каждой метке."""
+
+    def __init__(self, labels, win_sec: float, timeline: ProbabilityTimeline | None = None):
+        self.labels = list(labels)
+        self.win_sec = win_sec
+        self.timeline = timeline
+        self.count = 0
+        self.sum = np.zeros(len(self.labels), dtype=np.float64)
+        self.sumsq = np.zeros(len(self.labels), dtype=np.float64)
+        self.max = np.full(len(self.labels), -np.inf)
+        self.argmax = np.zeros(len(self.labels), dtype=np.int64)
+
+    def update(self, probs: np.ndarray, positions: np.ndarray | None = None):
+        # probs: (B, num_classes); positions — номера окон в записи (если часть окон отброшена)
+        if positions is None:
+            positions = self.count + np.arange(probs.shape[0])
+        cols = np.arange(probs.shape[1])
+        idx = probs.argmax(axis=0)
+        best = probs[idx, cols]
+        better = best > self.max
+        self.max = np.where(better, best, self.max)
+        self.argmax = np.where(better, positions[idx], self.argmax)
+        self.sum += probs.sum(axis=0)
+        self.sumsq += np.square(probs, dtype=np.float64).sum(axis=0)
+        self.count += probs.shape[0]
+        if self.timeline is not None:
+            self.timeline.update(probs, positions)
+
+    def mean(self) -> np.ndarray:
+        return self.sum / max(self.count, 1)
+
+    def ci_halfwidth(self, population: int, z: float = 1.96) -> np.ndarray:
+        """
+        Полуширина доверительного интервала среднего по каждой метке.
+        Выборка без возвращения из population окон: поправка на конечность → 0 на всей записи.
+        """
+        n = self.count
+        if n < 2:
+            return np.full(len(self.labels), np.inf)
+        var = np.maximum(self.sumsq / n - self.mean() ** 2, 0.0) * n / (n - 1)
+        fpc = (population - n) / max(population - 1, 1)
+        return z * np.sqrt(var / n * max(fpc, 0.0))
+
+    def result(self) -> dict:
+        mean = self.mean()
+        out = {label: float(mean[i]) for i, label in enumerate(self.labels)}
+        for i, label in enumerate(self.labels):
+            out[f"{label}_max"] = float(self.max[i])
+            out[f"{label}_max_time_sec"] = float(self.argmax[i] * self.win_sec)
+        out["windows"] = float(self.count)
+        return out
+
+@torch.no_grad()
+def infer_ecg_1d_streaming(model: torch.nn.Module, chunks: Iterable[np.ndarray], fs_src: int,
+                           fs_tgt: int = 250, win_sec: float = 10.0, batch_size: int = 64,
+                           quality_gate: bool = QUALITY_GATE_ENABLED, labels: Sequence[str] = LABELS,
+                           timeline: ProbabilityTimeline | None = None):
+    agg = OnlineAggregator(labels, win_sec, timeline)
+    stats = QualityStats()
+    seen = 0
+    for wins in stream_windows(chunks, fs_src, fs_tgt, win_sec, windows_per_block=batch_size):
+        positions = seen + np.arange(len(wins))
+        seen += len(wins)
+        if quality_gate:
+            good = stats.evaluate(wins, fs_tgt)
+            wins, positions = wins[good], positions[good]
+        if len(wins):
+            agg.update(predict_proba(model, normalize_windows(wins)), positions)
+    if timeline is not None:
+        timeline.windows = seen
+    if not quality_gate:
+        return agg.result()
+    # вердикт по всей записи: плохие участки Holter не валят её целиком, пока годных окон достаточно
+    quality = stats.check()
+    out = agg.result()
+    out.update(quality)
+    return out
+
+# ===================== Прогрессивный режим (early exit) =====================
+# Окна оцениваются мини-батчами в стратифицированном порядке (равномерно по всей записи);
+# остановка, когда среднее по всем меткам стабильно (ДИ уже PROGRESSIVE_TOLERANCE) или
+# находка подтверждена PROGRESSIVE_CONFIRM_WINDOWS окнами с вероятностью >= PROGRESSIVE_POSITIVE_THRESHOLD.
+
+PROGRESSIVE_INFERENCE = os.getenv("PROGRESSIVE_INFERENCE", "0") in ("1", "true", "True")
+PROGRESSIVE_BATCH_SIZE = int(os.getenv("PROGRESSIVE_BATCH_SIZE", "32"))
+PROGRESSIVE_MIN_WINDOWS = int(os.getenv("PROGRESSIVE_MIN_WINDOWS", "64"))
+PROGRESSIVE_TOLERANCE = float(os.getenv("PROGRESSIVE_TOLERANCE", "0.02"))
+PROGRESSIVE_POSITIVE_THRESHOLD = float(os.getenv("PROGRESSIVE_POSITIVE_THRESHOLD", "0.9"))
+PROGRESSIVE_CONFIRM_WINDOWS = int(os.getenv("PROGRESSIVE_CONFIRM_WINDOWS", "3"))
+NORMAL_LABEL = "Normal"  # остальные метки — находки для подтверждения
+
+def stratified_order(n: int) -> np.ndarray:
+    """
+    Порядок окон 0..n-1 с разворотом битов (последовательность ван дер Корпута):
+    любой префикс равномерно покрывает запись — начало, середину и конец.
+    """
+    if n <= 1:
+        return np.arange(n)
+    bits = int(np.ceil(np.log2(n)))
+    idx = np.arange(1 << bits)
+    rev = np.zeros_like(idx)
+    for b in range(bits):
+        rev |= ((idx >> b) & 1) << (bits - 1 - b)
+    return rev[rev < n]
+
+def windows_at(x: np.ndarray, idx: np.ndarray, fs_src: int, fs_tgt: int = 250,
+               win_sec: float = 10.0) -> np.ndarray:
+    """
+    Окна с номерами idx (шаг = win_sec), ресэмплинг только этих окон с контекстом RESAMPLE_PAD_SEC.
+    x: (samples,) или (leads, samples), может быть np.memmap — читаются только нужные участки файла.
+    """
+    g = gcd(int(fs_src), int(fs_tgt))
+    up, down = int(fs_tgt) // g, int(fs_src) // g
+    w_src = int(round(win_sec * fs_src))
+    w_tgt = int(round(win_sec * fs_tgt))
+    pad = 0 if up == down else down * int(np.ceil(RESAMPLE_PAD_SEC * fs_src / down))
+    out = np.zeros((len(idx), *x.shape[:-1], w_tgt), dtype=np.float32)
+    for k, i in enumerate(idx):
+        start = int(i) * w_src
+        lo, hi = max(0, start - pad), min(x.shape[-1], start + w_src + pad)
+        seg = np.asarray(x[..., lo:hi], dtype=np.float32)
+        if up != down:
+            seg = resample_poly(seg, up, down, axis=-1)
+        offset = (start - lo) * up // down
+        y = seg[..., offset:offset + w_tgt]
+        out[k, ..., :y.shape[-1]] = y  # запись короче окна — дополнение нулями, как to_windows_1d
+    return out
+
+@torch.no_grad()
+def infer_ecg_1d_progressive(model: torch.nn.Module, x_1d: np.ndarray, fs_src: int,
+                             fs_tgt: int = 250, win_sec: float = 10.0,
+                             batch_size: int = PROGRESSIVE_BATCH_SIZE,
+                             min_windows: int = PROGRESSIVE_MIN_WINDOWS,
+                             tolerance: float = PROGRESSIVE_TOLERANCE,
+                             positive_threshold: float = PROGRESSIVE_POSITIVE_THRESHOLD,
+                             confirm_windows: int = PROGRESSIVE_CONFIRM_WINDOWS,
+                             quality_gate: bool = QUALITY_GATE_ENABLED,
+                             labels: Sequence[str] = LABELS,
+                             timeline: ProbabilityTimeline | None = None):
+    total = max(1, x_1d.shape[-1] // int(round(win_sec * fs_src)))
+    order = stratified_order(total)
+    findings = np.array([i for i, label in enumerate(labels) if label != NORMAL_LABEL], dtype=np.int64)
+    # пропущенные ранним выходом окна остаются в шкале неоценёнными
+    if timeline is not None:
+        timeline.windows = total
+    agg = OnlineAggregator(labels, win_sec, timeline)
+    stats = QualityStats()
+    hits = np.zeros(len(findings), dtype=np.int64)
+    evaluated, reason = 0, None
+
+    for start in range(0, total, batch_size):
+        positions = order[start:start + batch_size]
+        wins = windows_at(x_1d, positions, fs_src, fs_tgt, win_sec)
+        evaluated += len(positions)
+        if quality_gate:
+            good = stats.evaluate(wins, fs_tgt)
+            wins, positions = wins[good], positions[good]
+        if not len(wins):
+            continue
+        probs = predict_proba(model, normalize_windows(wins))
+        agg.update(probs, positions)
+        hits += (probs[:, findings] >= positive_threshold).sum(axis=0)
+
+        if evaluated >= total:
+            break
+        if (hits >= confirm_windows).any():
+            reason = "positive"
+            break
+        if agg.count >= min_windows and (agg.ci_halfwidth(total) <= tolerance).all():
+            reason = "stable"
+            break
+
+    quality = stats.check() if quality_gate else {}
+    out = agg.result()
+    ci = agg.ci_halfwidth(total)
+    for i, label in enumerate(labels):
+        out[f"{label}_ci"] = float(min(ci[i], 1.0))
+    out["windows_evaluated"] = float(evaluated)
+    out["windows_total"] = float(total)
+    # 0 — оценены все окна, 1 — среднее стабилизировалось, 2 — подтверждена находка
+    out["early_exit"] = {None: 0.0, "stable": 1.0, "positive": 2.0}[reason]
+    out.update(quality)
+    return out
+
+@torch.no_grad()
+def warmup(model: torch.nn.Module, fs: int = 250, win_sec: float = 10.0,
+           batch_sizes: Sequence[int] = WARMUP_BATCH_SIZES, leads: int = 1):
+    """Прогон нулевых окон рабочих размеров: ленивая инициализация ядер не достаётся первому запросу."""
+    w = int(win_sec * fs)
+    shape = (w,) if leads == 1 else (leads, w)
+    for batch_size in batch_sizes:
+        predict_proba(model, np.zeros((batch_size, *shape), dtype=np.float32))
\ No newline at end of file
@@ -0,0 +1,143 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+# Гейт качества сигнала: окна с обрывом электрода, насыщением АЦП, шумом или дрейфом
+# изолинии отбрасываются до модели; если годных окон мало — запись не анализируется.
+
+SIGNAL_BAND_HZ = (0.5, 40.0)  # полоса ЭКГ; выше — шум (мышцы, сеть 50/60 Гц)
+WANDER_CUTOFF_HZ = 0.5        # ниже — дрейф изолинии (дыхание, движение)
+
+
+@dataclass(frozen=True)
+class QualityThresholds:
+    max_flatline_ratio: float = 0.5     # доля «плоских» соседних отсчётов
+    max_clipping_ratio: float = 0.05    # доля отсчётов у границ диапазона окна
+    min_snr_db: float = 3.0             # мощность в полосе ЭКГ / мощность выше полосы
+    max_baseline_wander: float = 0.5    # доля мощности ниже WANDER_CUTOFF_HZ
+    min_good_ratio: float = 0.3         # минимум годных окон от общего числа
+    min_good_windows: int = 1
+
+    @classmethod
+    def from_env(cls) -> "QualityThresholds":
+        return cls(
+            max_flatline_ratio=float(os.getenv("QUALITY_MAX_FLATLINE_RATIO", cls.max_flatline_ratio)),
+            max_clipping_ratio=float(os.getenv("QUALITY_MAX_CLIPPING_RATIO", cls.max_clipping_ratio)),
+            min_snr_db=float(os.getenv("QUALITY_MIN_SNR_DB", cls.min_snr_db)),
+            max_baseline_wander=float(os.getenv("QUALITY_MAX_BASELINE_WANDER", cls.max_baseline_wander)),
+            min_good_ratio=float(os.getenv("QUALITY_MIN_GOOD_RATIO", cls.min_good_ratio)),
+            min_good_windows=int(os.getenv("QUALITY_MIN_GOOD_WINDOWS", cls.min_good_windows)),
+        )
+
+
+QUALITY_GATE_ENABLED = os.getenv("QUALITY_GATE_ENABLED", "1") not in ("0", "false", "False")
+DEFAULT_THRESHOLDS = QualityThresholds.from_env()
+
+
+class PoorSignalQuality(Exception):
+    """Слишком мало годных окон: ответ анализатора — структурированная ошибка, а не вероятности."""
+
+    code = "poor_quality"
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+        super().__init__(
+            f"Низкое качество сигнала: годных окон {int(stats['quality_windows_used'])} "
+            f"из {int(stats['quality_windows_total'])}"
+        )
+
+
+def window_quality(wins: np.ndarray, fs: int) -> dict:
+    """
+    Показатели качества для всех окон сразу, wins: (N, L) или (N, leads, L) в исходных единицах (до нормализации).
+    Возвращает массивы формы (N,): flatline, clipping, snr_db, wander.
+    """
+    wins = np.asarray(wins, dtype=np.float32)
+    if wins.ndim == 3:
+        # несколько отведений: показатель окна — медиана по отведениям,
+        # одно отключённое отведение не бракует окно целиком
+        n, leads, length = wins.shape
+        q = window_quality(wins.reshape(n * leads, length), fs)
+        return {key: np.median(value.reshape(n, leads), axis=1) for key, value in q.items()}
+    lo = wins.min(axis=1, keepdims=True)
+    hi = wins.max(axis=1, keepdims=True)
+    span = hi - lo
+    scale = np.maximum(np.abs(wins).max(axis=1, keepdims=True), 1.0)
+
+    # обрыв электрода / постоянный уровень: соседние отсчёты не меняются
+    flatline = (np.abs(np.diff(wins, axis=1)) <= 1e-6 * scale).mean(axis=1)
+    # насыщение: отсчёты «прилипли» к минимуму или максимуму окна
+    tol = 1e-3 * span
+    clipping = ((wins >= hi - tol) | (wins <= lo + tol)).mean(axis=1)
+    # спектр без постоянной составляющей: SNR по полосе ЭКГ и доля дрейфа изолинии
+    power = np.abs(np.fft.rfft(wins - wins.mean(axis=1, keepdims=True), axis=1)) ** 2
+    freqs = np.fft.rfftfreq(wins.shape[1], d=1.0 / fs)
+    in_band = (freqs >= SIGNAL_BAND_HZ[0]) & (freqs <= SIGNAL_BAND_HZ[1])
+    tiny = np.finfo(np.float32).tiny
+    signal_power = power[:, in_band].sum(axis=1)
+    noise_power = power[:, freqs > SIGNAL_BAND_HZ[1]].sum(axis=1)
+    snr_db = 10.0 * np.log10((signal_power + tiny) / (noise_power + tiny))
+    wander = power[:, (freqs > 0) & (freqs < WANDER_CUTOFF_HZ)].sum(axis=1) / (power[:, 1:].sum(axis=1) + tiny)
+
+    return {"flatline": flatline, "clipping": clipping, "snr_db": snr_db, "wander": wander}
+
+
+def good_windows_mask(q: dict, th: QualityThresholds = DEFAULT_THRESHOLDS) -> np.ndarray:
+    return (
+        (q["flatline"] <= th.max_flatline_ratio)
+        & (q["clipping"] <= th.max_clipping_ratio)
+        & (q["snr_db"] >= th.min_snr_db)
+        & (q["wander"] <= th.max_baseline_wander)
+    )
+
+
+class QualityStats:
+    """Накопление показателей по окнам (в т.ч. по блокам потокового режима) для features."""
+
+    def __init__(self, thresholds: QualityThresholds = DEFAULT_THRESHOLDS):
+        self.thresholds = thresholds
+        self.total = 0
+        self.used = 0
+        self.rejected = {"flatline": 0, "clipping": 0, "snr": 0, "wander": 0}
+        self._sums = {"flatline": 0.0, "clipping": 0.0, "snr_db": 0.0, "wander": 0.0}
+
+    def evaluate(self, wins: np.ndarray, fs: int) -> np.ndarray:
+        """Оценивает окна и учитывает статистику; возвращает маску годных окон (N,)."""
+        q = window_quality(wins, fs)
+        th = self.thresholds
+        good = good_windows_mask(q, th)
+        self.total += len(wins)
+        self.used += int(good.sum())
+        self.rejected["flatline"] += int((q["flatline"] > th.max_flatline_ratio).sum())
+        self.rejected["clipping"] += int((q["clipping"] > th.max_clipping_ratio).sum())
+        self.rejected["snr"] += int((q["snr_db"] < th.min_snr_db).sum())
+        self.rejected["wander"] += int((q["wander"] > th.max_baseline_wander).sum())
+        for key in self._sums:
+            self._sums[key] += float(q[key].sum())
+        return good
+
+    def acceptable(self) -> bool:
+        th = self.thresholds
+        return self.used >= max(th.min_good_windows, int(np.ceil(th.min_good_ratio * self.total)))
+
+    def result(self) -> dict:
+        n = max(self.total, 1)
+        out = {
+            "quality_windows_total": float(self.total),
+            "quality_windows_used": float(self.used),
+            "quality_flatline_ratio": self._sums["flatline"] / n,
+            "quality_clipping_ratio": self._sums["clipping"] / n,
+            "quality_snr_db": self._sums["snr_db"] / n,
+            "quality_baseline_wander": self._sums["wander"] / n,
+        }
+        for reason, count in self.rejected.items():
+            out[f"quality_rejected_{reason}"] = float(count)
+        return out
+
+    def check(self) -> dict:
+        """Итоговая статистика; PoorSignalQuality, если годных окон недостаточно."""
+        stats = self.result()
+        if not self.acceptable():
+            raise PoorSignalQuality(stats)
+        return stats
@@ -0,0 +1,401 @@
+"""
+Реестр версий модели: локальный каталог или префикс в MinIO.
+
+    <root>/<version>/weights.pt   — state dict
+    <root>/<version>/meta.json    — метки, частота, длина окна, число отведений
+    <root>/DEFAULT                — версия по умолчанию (переключается атомарно)
+    <root>/DEFAULT-<n>            — версия по умолчанию для записей из n > 1 отведений
+
+Публикация и переключение версии без перезапуска воркеров:
+
+    python registry.py publish v2 /path/to/weights.pt --labels Normal,AF,PVC
+    python registry.py promote v2
+    python registry.py publish v2-12lead /path/to/weights.pt --in-channels 12
+    python registry.py promote v2-12lead   # станет DEFAULT-12: модель выбирается по числу отведений записи
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import torch
+
+from metrics import DEFAULT_MODEL_VERSION, LOADED_MODELS, MODEL_LOADS, stage
+from model import LABELS, MODEL_CACHE_DIR, build_model, load_model, save_state_dict, warmup
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(MODEL_CACHE_DIR, "registry"))
+# если задан бакет — реестр в MinIO, веса скачиваются в MODEL_CACHE_DIR один раз на версию
+MODEL_REGISTRY_BUCKET = os.getenv("MODEL_REGISTRY_BUCKET", "")
+MODEL_REGISTRY_PREFIX = os.getenv("MODEL_REGISTRY_PREFIX", "models/ecg").strip("/")
+MODEL_LRU_SIZE = int(os.getenv("MODEL_LRU_SIZE", "3"))
+MODEL_REGISTRY_POLL_SEC = float(os.getenv("MODEL_REGISTRY_POLL_SEC", "30"))
+# число отведений, для которых версии по умолчанию загружаются и прогреваются при старте;
+# записи с другим числом отведений подгружают свою версию при первом запросе
+MODEL_LEAD_COUNTS = tuple(int(n) for n in os.getenv("MODEL_LEAD_COUNTS", "1,12").split(","))
+# пустой реестр: публикуются модели со случайной инициализацией, чтобы воркер мог стартовать;
+# сид фиксирован — реплики, стартующие одновременно, публикуют под одной версией одинаковые веса
+BOOTSTRAP_VERSION = "ecg-crnn-{leads}lead-v0"
+BOOTSTRAP_SEED = 0
+
+WEIGHTS_FILE = "weights.pt"
+META_FILE = "meta.json"
+DEFAULT_FILE = "DEFAULT"
+VERSION_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,99}$")
+
+
+class UnknownModelVersion(LookupError):
+    pass
+
+
+def default_file(leads: int = 1) -> str:
+    # одно отведение — прежний DEFAULT, чтобы существующие реестры не менялись
+    return DEFAULT_FILE if leads == 1 else f"{DEFAULT_FILE}-{leads}"
+
+
+def check_version(version: str) -> str:
+    # версия приходит из сообщения и становится частью пути/ключа — только безопасные имена
+    if not isinstance(version, str) or not VERSION_RE.match(version):
+        raise UnknownModelVersion(f"Недопустимое имя версии модели: {version!r}")
+    return version
+
+
+@dataclass(frozen=True)
+class ModelMeta:
+    version: str
+    labels: List[str] = field(default_factory=lambda: list(LABELS))
+    fs: int = 250          # целевая частота дискретизации
+    win_sec: float = 10.0  # длина окна
+    in_channels: int = 1   # число отведений
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ModelMeta":
+        return cls(**{k: data[k] for k in cls.__dataclass_fields__ if k in data})
+
+
+@dataclass
+class LoadedModel:
+    meta: ModelMeta
+    model: torch.nn.Module
+
+    @property
+    def version(self) -> str:
+        return self.meta.version
+
+
+class LocalModelStore:
+    def __init__(self, root: str = MODEL_REGISTRY_DIR):
+        self.root = root
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+    def versions(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(v for v in os.listdir(self.root) if os.path.exists(self._path(v, META_FILE)))
+
+    def read_meta(self, version: str) -> ModelMeta:
+        try:
+            with open(self._path(check_version(version), META_FILE)) as f:
+                return ModelMeta.from_dict(json.load(f))
+        except FileNotFoundError:
+            raise UnknownModelVersion(f"Версия модели {version} не найдена в реестре")
+
+    def weights_path(self, version: str) -> str:
+        return self._path(check_version(version), WEIGHTS_FILE)
+
+    def get_default(self, leads: int = 1) -> Optional[str]:
+        try:
+            with open(self._path(default_file(leads))) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write_atomic(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def set_default(self, version: str):
+        meta = self.read_meta(version)  # нельзя переключиться на несуществующую версию
+        self._write_atomic(self._path(default_file(meta.in_channels)), version.encode())
+
+    def publish(self, meta: ModelMeta, weights_path: str):
+        check_version(meta.version)
+        os.makedirs(self._path(meta.version), exist_ok=True)
+        shutil.copyfile(weights_path, self.weights_path(meta.version))
+        # meta.json последним: версия видна в реестре только целиком
+        self._write_atomic(self._path(meta.version, META_FILE), json.dumps(asdict(meta)).encode())
+
+
+class MinioModelStore:
+    def __init__(self, client, bucket: str = MODEL_REGISTRY_BUCKET, prefix: str = MODEL_REGISTRY_PREFIX,
+                 cache_dir: str = MODEL_CACHE_DIR):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_dir = cache_dir
+
+    def _key(self, *parts: str) -> str:
+        return "/".join([self.prefix, *parts])
+
+    def _read(self, key: str) -> Optional[bytes]:
+        from minio.error import S3Error
+
+        try:
+            response = self.client.get_object(self.bucket, key)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket"):
+                return None
+            raise
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def versions(self) -> List[str]:
+        if not self.client.bucket_exists(self.bucket):
+            return []
+        objects = self.client.list_objects(self.bucket, prefix=self.prefix + "/")
+        return sorted(o.object_name[len(self.prefix) + 1:].rstrip("/") for o in objects if o.is_dir)
+
+    def read_meta(self, version: str) -> ModelMeta:
+        data = self._read(self._key(check_version(version), META_FILE))
+        if data is None:
+            raise UnknownModelVersion(f"Версия модели {version} не найдена в реестре")
+        return ModelMeta.from_dict(json.loads(data))
+
+    def weights_path(self, version: str) -> str:
+        # веса версии неизменяемы: скачиваются один раз и переживают рестарт (MODEL_CACHE_DIR)
+        path = os.path.join(self.cache_dir, check_version(version), WEIGHTS_FILE)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            os.close(fd)
+            self.client.fget_object(self.bucket, self._key(version, WEIGHTS_FILE), tmp_path)
+            os.replace(tmp_path, path)
+        return path
+
+    def get_default(self, leads: int = 1) -> Optional[str]:
+        data = self._read(self._key(default_file(leads)))
+        return (data.decode().strip() or None) if data else None
+
+    def _put(self, key: str, data: bytes):
+        self.client.put_object(self.bucket, key, io.BytesIO(data), length=len(data))
+
+    def set_default(self, version: str):
+        meta = self.read_meta(version)
+        # перезапись одного объекта атомарна: читатели видят старую или новую версию
+        self._put(self._key(default_file(meta.in_channels)), version.encode())
+
+    def publish(self, meta: ModelMeta, weights_path: str):
+        check_version(meta.version)
+        if not self.client.bucket_exists(self.bucket):
+            self.client.make_bucket(self.bucket)
+        self.client.fput_object(self.bucket, self._key(meta.version, WEIGHTS_FILE), weights_path)
+        self._put(self._key(meta.version, META_FILE), json.dumps(asdict(meta)).encode())
+
+
+class ModelRegistry:
+    """
+    Загруженные версии модели в ограниченном LRU (версии по умолчанию не вытесняются).
+    Новая версия загружается и прогревается до переключения, поэтому консьюмеры не простаивают:
+    текущие задачи дорабатывают на старой модели, следующие берут новую.
+    Версия по умолчанию своя для каждого числа отведений (in_channels модели).
+    """
+
+    def __init__(self, store, capacity: int = MODEL_LRU_SIZE, warm: bool = True):
+        self.store = store
+        self.capacity = max(1, capacity)
+        self.warm = warm
+        # число отведений -> версия; словарь заменяется целиком, читатели видят старый или новый
+        self.default_versions: Dict[int, str] = {}
+        self._models: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def default_version(self) -> Optional[str]:
+        return self.default_versions.get(1)
+
+    def bootstrap(self):
+        if self.store.versions():
+            return
+        for leads in MODEL_LEAD_COUNTS:
+            meta = ModelMeta(version=BOOTSTRAP_VERSION.format(leads=leads), in_channels=leads)
+            try:
+                self.store.read_meta(meta.version)
+                continue  # опубликовала другая реплика
+            except UnknownModelVersion:
+                pass
+            with tempfile.TemporaryDirectory() as tmp, torch.random.fork_rng():
+                torch.manual_seed(BOOTSTRAP_SEED)
+                weights_path = os.path.join(tmp, WEIGHTS_FILE)
+                save_state_dict(build_model(in_channels=meta.in_channels, classes=meta.labels), weights_path)
+                self.store.publish(meta, weights_path)
+            if not self.store.get_default(leads):
+                self.store.set_default(meta.version)
+            print(f"Реестр моделей пуст: опубликована {meta.version}")
+
+    def _cached(self, version: str) -> Optional[LoadedModel]:
+        with self._lock:
+            entry = self._models.get(version)
+            if entry is not None:
+                self._models.move_to_end(version)
+            return entry
+
+    def default_for(self, leads: int = 1) -> str:
+        version = self.default_versions.get(leads)
+        if version is None:
+            if leads == 1:
+                raise RuntimeError("Модель по умолчанию ещё не загружена")
+            # первая запись с таким числом отведений: версия читается из реестра,
+            # дальше её обновляет _poll_loop вместе с остальными
+            version = self.store.get_default(leads)
+            if not version:
+                raise UnknownModelVersion(f"В реестре нет модели по умолчанию для {leads} отведений")
+            self.set_default(version)
+        return version
+
+    def get(self, version: Optional[str] = None, leads: Optional[int] = None) -> LoadedModel:
+        """
+        Версия по имени или по умолчанию для leads отведений (None — одно).
+        С leads версия из сообщения проверяется на совпадение числа отведений с записью.
+        """
+        version = version or self.default_for(leads or 1)
+        entry = self._cached(version)
+        if entry is None:
+            # загрузки редкие: одна за раз, повторный запрос той же версии дождётся первой
+            with self._load_lock:
+                entry = self._cached(version)
+                if entry is None:
+                    entry = self._load(version)
+                    with self._lock:
+                        self._models[version] = entry
+                        self._evict()
+                        LOADED_MODELS.set(len(self._models))
+        if leads is not None and entry.meta.in_channels != leads:
+            raise ValueError(f"Модель {version} рассчитана на {entry.meta.in_channels} отведений, в записи {leads}")
+        return entry
+
+    def _load(self, version: str) -> LoadedModel:
+        with stage("model_load") as span:
+            span.set_attribute("model.version", version)
+            meta = self.store.read_meta(version)
+            model = load_model(self.store.weights_path(version), in_channels=meta.in_channels,
+                               classes=meta.labels)
+            if self.warm:
+                warmup(model, fs=meta.fs, win_sec=meta.win_sec, leads=meta.in_channels)
+        MODEL_LOADS.labels(version=version).inc()
+        print(f"Model {version} loaded")
+        return LoadedModel(meta=meta, model=model)
+
+    def _evict(self):
+        # самые давние — первыми; версии по умолчанию остаются всегда
+        defaults = set(self.default_versions.values())
+        for version in list(self._models):
+            if len(self._models) <= self.capacity:
+                break
+            if version not in defaults:
+                del self._models[version]
+
+    def set_default(self, version: str) -> LoadedModel:
+        entry = self.get(version)  # загрузка и прогрев — до переключения
+        leads = entry.meta.in_channels
+        previous = self.default_versions.get(leads)
+        self.default_versions = {**self.default_versions, leads: version}  # замена одной ссылки
+        if previous:
+            DEFAULT_MODEL_VERSION.labels(version=previous).set(0)
+        DEFAULT_MODEL_VERSION.labels(version=version).set(1)
+        print(f"Default model ({leads} leads): {previous} -> {version}")
+        return entry
+
+    def refresh_default(self) -> bool:
+        """Подхватывает DEFAULT-файлы из хранилища; True, если сменилась хотя бы одна версия по умолчанию."""
+        changed = False
+        for leads in sorted(set(MODEL_LEAD_COUNTS) | set(self.default_versions)):
+            version = self.store.get_default(leads)
+            if version and version != self.default_versions.get(leads):
+                self.set_default(version)
+                changed = True
+        return changed
+
+    def _poll_loop(self):
+        while not self._stop.wait(MODEL_REGISTRY_POLL_SEC * random.uniform(0.8, 1.2)):
+            try:
+                self.refresh_default()
+            except Exception as e:
+                # реестр недоступен или версия битая — продолжаем на текущей модели
+                print(f"Ошибка обновления модели по умолчанию: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._poll_loop, name="model-registry", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def open_store(minio_client=None):
+    if MODEL_REGISTRY_BUCKET:
+        return MinioModelStore(minio_client)
+    return LocalModelStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Реестр версий модели ECG")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    publish = sub.add_parser("publish")
+    publish.add_argument("version")
+    publish.add_argument("weights")
+    publish.add_argument("--labels", default=",".join(LABELS))
+    publish.add_argument("--fs", type=int, default=250)
+    publish.add_argument("--win-sec", type=float, default=10.0)
+    publish.add_argument("--in-channels", type=int, default=1)
+    promote = sub.add_parser("promote")
+    promote.add_argument("version")
+    args = parser.parse_args()
+
+    minio_client = None
+    if MODEL_REGISTRY_BUCKET:
+        from minio import Minio
+
+        minio_client = Minio(os.getenv("MINIO_ENDPOINT", "localhost:9000"),
+                             access_key=os.getenv("MINIO_ACCESS_KEY", "minioadmin"),
+                             secret_key=os.getenv("MINIO_SECRET_KEY", "minioadmin"), secure=False)
+    store = open_store(minio_client)
+
+    if args.command == "list":
+        for version in store.versions():
+            meta = store.read_meta(version)
+            default = store.get_default(meta.in_channels)
+            print(("* " if version == default else "  ") + json.dumps(asdict(meta)))
+    elif args.command == "publish":
+        meta = ModelMeta(version=args.version, labels=args.labels.split(","), fs=args.fs,
+                         win_sec=args.win_sec, in_channels=args.in_channels)
+        # проверка, что веса подходят к архитектуре, до публикации
+        load_model(args.weights, in_channels=meta.in_channels, classes=meta.labels)
+        store.publish(meta, args.weights)
+        print(f"Published {meta.version}")
+    elif args.command == "promote":
+        store.set_default(args.version)
+        print(f"Default model -> {args.version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+# модули сервиса импортируются как в service.py (from jobs import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+class FakeChannel:
+    """Локальная замена канала RabbitMQ: запоминает ответы и подтверждения"""
+
+    def __init__(self):
+        self.published = []
+        self.acked = []
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append((routing_key, json.loads(body)))
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+
+@pytest.fixture
+def channel():
+    return FakeChannel()
+
+
+@pytest.fixture
+def deliver(channel):
+    """Доставляет задачу в очередь воркера; возвращает статус handle_request"""
+    import service
+
+    def deliver(msg: dict, queue: str = service.REQUEST_QUEUE, delivery_tag: int = 1) -> str:
+        method = SimpleNamespace(routing_key=queue, delivery_tag=delivery_tag)
+        props = SimpleNamespace(headers=None, reply_to=None, correlation_id=None)
+        lane = "long" if queue == service.LONG_REQUEST_QUEUE else "short"
+        return service.handle_request(channel, method, props, json.dumps(msg).encode(), lane)
+
+    return deliver
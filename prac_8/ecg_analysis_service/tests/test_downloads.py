@@ -0,0 +1,64 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import service
+from quality import PoorSignalQuality
+from registry import LoadedModel, ModelMeta
+
+
+class StubRegistry:
+    def get(self, version=None, leads=None):
+        return LoadedModel(meta=ModelMeta(version="stub-v1", in_channels=leads or 1), model=None)
+
+
+@pytest.fixture
+def downloads(tmp_path, monkeypatch):
+    """Скачанные файлы: запись лежит во временном каталоге, как после fget_object"""
+    paths = []
+
+    def download(bucket, object_name):
+        path = str(tmp_path / f"download-{len(paths)}")
+        with open(path, "wb") as f:
+            np.save(f, np.zeros(4000, dtype=np.float32))
+        paths.append(path)
+        return path
+
+    monkeypatch.setattr(service, "download_from_minio", download)
+    monkeypatch.setattr(service, "REGISTRY", StubRegistry())
+    monkeypatch.setattr(service, "TIMELINE_ENABLED", False)
+    return paths
+
+
+def job(**fields) -> dict:
+    return {"measurement_id": "m-1", "bucket": "ecg-bucket", "object_name": "m-1.npy", "format": "npy",
+            "fs": 200, "deadline": time.time() + 60, "skip_llm": True, **fields}
+
+
+def test_streaming_download_removed(deliver, downloads, monkeypatch):
+    def infer(chunks, **kwargs):
+        return {"samples": float(sum(c.shape[-1] for c in chunks))}
+
+    monkeypatch.setattr(service, "infer_ecg_1d_streaming", infer)
+
+    assert deliver(job(lane="long", progressive=False), queue=service.LONG_REQUEST_QUEUE) == "ok"
+    assert downloads and not any(os.path.exists(p) for p in downloads)
+
+
+def test_progressive_memmap_download_removed(deliver, downloads, monkeypatch):
+    monkeypatch.setattr(service, "infer_ecg_1d_progressive", lambda x_1d, **kwargs: {"samples": float(len(x_1d))})
+
+    assert deliver(job(lane="long", progressive=True), queue=service.LONG_REQUEST_QUEUE) == "ok"
+    assert downloads and not any(os.path.exists(p) for p in downloads)
+
+
+def test_download_removed_when_analysis_fails(deliver, downloads, monkeypatch):
+    def infer(x_1d, **kwargs):
+        raise PoorSignalQuality({"quality_windows_used": 0, "quality_windows_total": 1})
+
+    monkeypatch.setattr(service, "infer_ecg_1d", infer)
+
+    assert deliver(job(progressive=False)) == "poor_quality"
+    assert downloads and not any(os.path.exists(p) for p in downloads)
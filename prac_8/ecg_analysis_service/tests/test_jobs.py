@@ -0,0 +1,78 @@
+import json
+import time
+
+import pytest
+
+import service
+from jobs import CancelRegistry, deadline_exceeded
+
+
+def job(**fields) -> dict:
+    return {"measurement_id": "m-1", "bucket": "ecg-bucket", "object_name": "m-1.npy", "fs": 200, **fields}
+
+
+@pytest.fixture(autouse=True)
+def no_download(monkeypatch):
+    downloads = []
+
+    def download(bucket, object_name):
+        downloads.append(object_name)
+        raise AssertionError("файл не должен скачиваться")
+
+    monkeypatch.setattr(service, "download_from_minio", download)
+    monkeypatch.setattr(service, "CANCELLED", CancelRegistry())
+    return downloads
+
+
+def test_deadline_exceeded():
+    assert not deadline_exceeded({})
+    assert not deadline_exceeded({"deadline": 100}, now=99)
+    assert deadline_exceeded({"deadline": 100}, now=101)
+    assert deadline_exceeded({"deadline": "100.5"}, now=101)
+
+
+def test_cancel_registry_expires_entries():
+    reg = CancelRegistry(ttl_sec=10)
+    reg.cancel("m-1", now=0)
+    assert reg.is_cancelled("m-1", now=5)
+    assert not reg.is_cancelled("m-1", now=11)
+    assert not reg.is_cancelled("m-2", now=5)
+    assert len(reg) == 0
+
+
+def test_cancel_registry_bounded():
+    reg = CancelRegistry(ttl_sec=100, max_size=2)
+    for i in range(3):
+        reg.cancel(f"m-{i}", now=i)
+    assert len(reg) == 2
+    assert not reg.is_cancelled("m-0", now=3)
+    assert reg.is_cancelled("m-2", now=3)
+
+
+def test_expired_job_acked_without_download(channel, deliver, no_download):
+    status = deliver(job(deadline=time.time() - 1))
+
+    assert status == "error"
+    assert no_download == []
+    assert channel.acked == [1]
+    (queue, response), = channel.published
+    assert queue == service.RESPONSE_QUEUE
+    assert response["status"] == "error"
+    assert response["measurement_id"] == "m-1"
+
+
+def test_cancelled_job_skipped(channel, deliver, no_download):
+    service.on_cancel(None, None, None, json.dumps({"measurement_id": "m-1"}).encode())
+
+    status = deliver(job(deadline=time.time() + 60), queue=service.LONG_REQUEST_QUEUE)
+
+    assert status == "cancelled"
+    assert no_download == []
+    assert channel.acked == [1]
+    # отменённой задаче ответ не нужен: measurement уже не в processing
+    assert channel.published == []
+
+
+def test_invalid_cancel_message_ignored():
+    service.on_cancel(None, None, None, b"not json")
+    assert len(service.CANCELLED) == 0
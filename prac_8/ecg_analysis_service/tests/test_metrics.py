@@ -0,0 +1,16 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from metrics import stage
+
+
+def observed(name: str) -> float:
+    return REGISTRY.get_sample_value("ecg_worker_stage_duration_seconds_count", {"stage": name}) or 0.0
+
+
+def test_failed_stage_is_timed():
+    before = observed("test_download")
+    with pytest.raises(OSError):
+        with stage("test_download"):
+            raise OSError("MinIO недоступен")
+    assert observed("test_download") == before + 1
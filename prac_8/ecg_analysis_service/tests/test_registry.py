@@ -0,0 +1,29 @@
+import torch
+
+import registry
+from registry import ModelRegistry, LocalModelStore
+
+
+def test_bootstrap_publishes_same_weights_on_every_replica(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "MODEL_LEAD_COUNTS", (1,))
+    weights = []
+    for replica in range(2):
+        root = tmp_path / f"replica-{replica}"
+        torch.manual_seed(replica)  # разное состояние RNG процессов
+        ModelRegistry(LocalModelStore(str(root)), warm=False).bootstrap()
+        weights.append(torch.load(root / "ecg-crnn-1lead-v0" / "weights.pt"))
+        assert (root / "DEFAULT").read_text() == "ecg-crnn-1lead-v0"
+
+    assert weights[0].keys() == weights[1].keys()
+    assert all(torch.equal(weights[0][k], weights[1][k]) for k in weights[0])
+
+
+def test_bootstrap_skips_non_empty_registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "MODEL_LEAD_COUNTS", (1,))
+    store = LocalModelStore(str(tmp_path))
+    ModelRegistry(store, warm=False).bootstrap()
+    mtime = (tmp_path / "ecg-crnn-1lead-v0" / "weights.pt").stat().st_mtime_ns
+
+    ModelRegistry(store, warm=False).bootstrap()
+
+    assert (tmp_path / "ecg-crnn-1lead-v0" / "weights.pt").stat().st_mtime_ns == mtime
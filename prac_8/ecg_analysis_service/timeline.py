@@ -0,0 +1,50 @@
+"""
+Шкала вероятностей по окнам: матрица (окна, метки) в uint8 для ответов Holter.
+
+q = round(p * 254); 255 — окно не оценено (отброшено по качеству или пропущено прогрессивным режимом).
+Сутки с окнами по 10 с и тремя метками — 8640 * 3 = 26 КБ, в ответ идёт base64 вместе с признаками.
+"""
+import base64
+import os
+from typing import Sequence
+
+import numpy as np
+
+TIMELINE_ENABLED = os.getenv("TIMELINE_ENABLED", "1") in ("1", "true", "True")
+TIMELINE_ENCODING = "u8"
+QUANT_MAX = 254
+MISSING = 255
+
+
+def quantize(probs: np.ndarray) -> np.ndarray:
+    return np.rint(np.clip(probs, 0.0, 1.0) * QUANT_MAX).astype(np.uint8)
+
+
+class ProbabilityTimeline:
+    """Копит вероятности окон по их номерам в записи; windows — общее число окон (задаёт инференс)."""
+
+    def __init__(self, labels: Sequence[str], win_sec: float):
+        self.labels = list(labels)
+        self.win_sec = win_sec
+        self.windows = 0
+        self._positions = []
+        self._values = []
+
+    def update(self, probs: np.ndarray, positions: np.ndarray):
+        self._positions.append(np.asarray(positions, dtype=np.int64))
+        self._values.append(quantize(probs))
+
+    def matrix(self) -> np.ndarray:
+        mat = np.full((self.windows, len(self.labels)), MISSING, dtype=np.uint8)
+        if self._positions:
+            mat[np.concatenate(self._positions)] = np.concatenate(self._values)
+        return mat
+
+    def to_message(self) -> dict:
+        return {
+            "labels": self.labels,
+            "win_sec": self.win_sec,
+            "windows": self.windows,
+            "encoding": TIMELINE_ENCODING,
+            "data_b64": base64.b64encode(self.matrix().tobytes()).decode("ascii"),
+        }
@@ -0,0 +1,39 @@
+import os
+from typing import Optional
+
+from opentelemetry import propagate, trace
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.trace import SpanKind
+
+JAEGER_URL = os.getenv("JAEGER_URL")
+
+tracer = trace.get_tracer("ecg_analysis_service")
+
+
+def setup_tracing():
+    # без JAEGER_URL спаны не экспортируются (no-op tracer), воркер работает как раньше
+    if not JAEGER_URL:
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": "ecg_analysis_service"}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=JAEGER_URL)))
+    trace.set_tracer_provider(provider)
+
+
+def amqp_headers() -> dict:
+    """W3C trace context текущего спана для заголовков AMQP-сообщения"""
+    headers = {}
+    propagate.inject(headers)
+    return headers
+
+
+def consume_span(queue: str, headers: Optional[dict]):
+    """Спан обработки сообщения — продолжение трейса chat_service из заголовков"""
+    return tracer.start_as_current_span(
+        f"{queue} process",
+        context=propagate.extract(headers or {}),
+        kind=SpanKind.CONSUMER,
+        attributes={"messaging.system": "rabbitmq", "messaging.source.name": queue},
+    )